@@ -0,0 +1,205 @@
+# Асинхронные вью для самых частых запросов на чтение.
+#
+# Подключаются вместо вьюсетов DRF, когда проект запущен под ASGI
+# (settings.ASYNC_VIEWS, см. foodgram/asgi.py): GET /api/recipes/,
+# /api/recipes/{id}/, /api/tags/, /api/ingredients/ и /s/{код}/.
+# Запросы к БД идут через async ORM Django, поэтому воркер не простаивает,
+# пока медленный клиент передает запрос или читает ответ.
+# Ответы совпадают с ответами вьюсетов. Прочие методы и редкие случаи
+# (сортировка ?ordering=, поиск ?search=, фасеты ?facets=, пагинация
+# по курсору) передаются синхронным вьюсетам.
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
+from django_filters.utils import translate_validation
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.authentication import CachedTokenAuthentication
+from api.filters import ExtraParamsFilter
+from api.fragments import arender_recipes
+from api.mixins import (
+    get_prerendered,
+    not_modified,
+    prerendered_response,
+    set_prerendered,
+)
+from api.serializers import IngredientSerializer, TagSerializer
+from api.utils import search_limit
+from api.views import (
+    IngredientViewSet,
+    RecipeViewSet,
+    TagViewSet,
+    legacy_recipe_id,
+)
+from recipes.constants import (
+    CURSOR,
+    FACETS,
+    LIMIT,
+    NAME,
+    PAGINATION,
+    SEARCH,
+)
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import ingredient_index
+from recipes.short_links import decode_code
+from recipes.versioning import INGREDIENTS, TAGS, aget_data_version
+
+recipe_list_view = RecipeViewSet.as_view(
+    {'get': 'list', 'post': 'create'}, basename='recipes', detail=False)
+recipe_detail_view = RecipeViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+     'delete': 'destroy'}, basename='recipes', detail=True)
+tag_list_view = TagViewSet.as_view(
+    {'get': 'list'}, basename='tags', detail=False)
+ingredient_list_view = IngredientViewSet.as_view(
+    {'get': 'list'}, basename='ingredients', detail=False)
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status,
+                        content_type='application/json')
+
+
+def error_response(error):
+    """Ответ на исключение DRF, как у его exception_handler."""
+    response = json_response(
+        error.detail if isinstance(error.detail, (list, dict))
+        else {'detail': error.detail},
+        status=error.status_code,
+    )
+    auth_header = getattr(error, 'auth_header', None)
+    if auth_header:
+        response['WWW-Authenticate'] = auth_header
+    return response
+
+
+def async_read(sync_view):
+    """
+    Асинхронная обработка GET-запроса с аутентификацией по токену.
+    Другие методы, а также GET, для которых вью вернула None,
+    обрабатывает синхронная вью sync_view.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method == 'GET':
+                try:
+                    authenticator = CachedTokenAuthentication()
+                    result = await authenticator.aauthenticate(request)
+                    request.user = (AnonymousUser() if result is None
+                                    else result[0])
+                    response = await view(request, *args, **kwargs)
+                except APIException as error:
+                    if getattr(error, 'status_code', None) == 401:
+                        error.auth_header = (
+                            authenticator.authenticate_header(request))
+                    response = error_response(error)
+                if response is not None:
+                    return response
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        # Как у вьюсетов DRF; csrf_exempt в Django 4.2 не умеет async.
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+async def prerendered_list(request, name, queryset, serializer_class):
+    """Асинхронный вариант PrerenderedListMixin.list."""
+    version = await aget_data_version(name)
+    response = not_modified(request, name, version)
+    if response is not None:
+        return response
+    cached = get_prerendered(name, version)
+    if cached is None:
+        objects = [obj async for obj in queryset]
+        cached = set_prerendered(
+            name, version, serializer_class(objects, many=True).data)
+    return prerendered_response(request, name, version, cached)
+
+
+@async_read(tag_list_view)
+async def tag_list(request):
+    return await prerendered_list(request, TAGS, Tag.objects.all(),
+                                  TagSerializer)
+
+
+@async_read(ingredient_list_view)
+async def ingredient_list(request):
+    name = request.GET.get(NAME)
+    if name is None:
+        return await prerendered_list(request, INGREDIENTS,
+                                      Ingredient.objects.all(),
+                                      IngredientSerializer)
+    try:
+        limit = search_limit(request.GET.get(LIMIT))
+    except ValueError:
+        return json_response({LIMIT: 'Укажите целое положительное число.'},
+                             status=400)
+    return json_response(await ingredient_index.asearch(name, limit))
+
+
+def recipes_for(request):
+    user = request.user
+    return (Recipe.objects
+            .with_user_flags(user)
+            .with_author_subscription(user)
+            .order_by(*RecipeViewSet.ordering))
+
+
+async def paginate(request, queryset):
+    """
+    Страница рецептов через пагинатор вьюсета (PageOrCursorPagination
+    в режиме по умолчанию): count, next, previous, results.
+    """
+    paginator = RecipeViewSet.pagination_class()
+    # COUNT(*) и запрос страницы - за один переход в поток.
+    recipes = await sync_to_async(paginator.paginate_queryset)(
+        queryset, Request(request))
+    return paginator.get_paginated_response(
+        await arender_recipes(recipes, request)).data
+
+
+@async_read(recipe_list_view)
+async def recipe_list(request):
+    params = request.GET
+    if (api_settings.ORDERING_PARAM in params or SEARCH in params
+            or FACETS in params
+            or params.get(PAGINATION) == CURSOR or CURSOR in params):
+        return None
+    queryset = recipes_for(request)
+    filterset = ExtraParamsFilter(params, queryset, request=request)
+    if any(name in params for name in filterset.filters):
+        # Проверка автора и перестроение словаря слагов тегов
+        # (recipes.tags) обращаются к БД.
+        if not await sync_to_async(filterset.is_valid)():
+            return error_response(translate_validation(filterset.errors))
+        queryset = await sync_to_async(lambda: filterset.qs)()
+    return json_response(await paginate(request, queryset))
+
+
+@async_read(recipe_detail_view)
+async def recipe_detail(request, pk):
+    if request.GET:
+        return None
+    recipe = await recipes_for(request).filter(pk=pk).afirst()
+    if recipe is None:
+        # Текст как у get_object_or_404 во вьюсете.
+        raise NotFound(f'No {Recipe._meta.object_name} matches the '
+                       'given query.')
+    return json_response((await arender_recipes([recipe], request))[0])
+
+
+async def redirect_to_full(request, short_url_code):
+    """Асинхронный вариант api.views.redirect_to_full."""
+    recipe_id = decode_code(short_url_code)
+    if recipe_id is None:
+        recipe_id = await sync_to_async(legacy_recipe_id)(short_url_code)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f'/recipes/{recipe_id}')
@@ -0,0 +1,156 @@
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    TokenAuthentication,
+    get_authorization_header,
+)
+
+TOKEN_KEY = 'auth-token:{}'
+USER_VERSION = 'auth-user:{}'
+
+
+class TokenCache:
+    """
+    Кэш токен -> пользователь: LRU ограниченного размера с TTL
+    в памяти процесса и, по желанию, в кэше Django.
+
+    Каждая запись помнит версию пользователя на момент загрузки.
+    Версия хранится в кэше Django и меняется при сохранении и удалении
+    пользователя и его токенов (api.signals); запись с другой версией
+    или без версии в кэше недействительна. Попадание в кэш не обращается
+    к базе. Чтобы выход и деактивация сразу действовали во всех
+    воркерах, кэш Django должен быть общим (Memcached, Redis); с кэшем
+    в памяти процесса другие воркеры увидят их через TIMEOUT секунд.
+    QuerySet.update() сигналов не отправляет: такие изменения
+    пользователей тоже действуют не позже чем через TIMEOUT секунд.
+    """
+
+    def __init__(self, max_size, timeout, use_django_cache):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.use_django_cache = use_django_cache
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    @staticmethod
+    def shared_key(key):
+        # В общий кэш кладем не сам токен, а его хэш.
+        return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None and self.use_django_cache:
+            entry = cache.get(self.shared_key(key))
+        if entry is None:
+            return None
+        user, version, expires = entry
+        if (expires < time.monotonic()
+                or version != cache.get(USER_VERSION.format(user.pk))):
+            self.delete(key)
+            return None
+        if key not in self.entries:
+            self.remember(key, entry)
+        return user
+
+    def set(self, key, user):
+        version_key = USER_VERSION.format(user.pk)
+        cache.add(version_key, time.time_ns(), None)
+        entry = (user, cache.get(version_key),
+                 time.monotonic() + self.timeout)
+        self.remember(key, entry)
+        if self.use_django_cache:
+            cache.set(self.shared_key(key), entry, self.timeout)
+
+    def remember(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.use_django_cache:
+            cache.delete(self.shared_key(key))
+
+    def invalidate_user(self, user_id):
+        """
+        Закэшированные токены пользователя недействительны.
+        Версия меняется сразу и еще раз после фиксации транзакции:
+        запись, загруженная другим воркером до фиксации, тоже устареет.
+        """
+        def bump():
+            cache.set(USER_VERSION.format(user_id), time.time_ns(), None)
+        bump()
+        transaction.on_commit(bump)
+
+
+token_cache = TokenCache(
+    max_size=settings.TOKEN_AUTH_CACHE['MAX_SIZE'],
+    timeout=settings.TOKEN_AUTH_CACHE['TIMEOUT'],
+    use_django_cache=settings.TOKEN_AUTH_CACHE['USE_DJANGO_CACHE'],
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication с кэшем токен -> пользователь (TokenCache).
+    Для закэшированного токена запросы к Token и User не выполняются.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = self.get_cached(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user)
+        return user, token
+
+    async def aauthenticate(self, request):
+        """
+        authenticate для асинхронных вью (api.async_views):
+        при промахе кэша токен ищется через async ORM.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. No credentials provided.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        cached = self.get_cached(key)
+        if cached is not None:
+            return cached
+        token = await (self.get_model().objects.select_related('user')
+                       .filter(key=key).afirst())
+        if token is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        token_cache.set(key, token.user)
+        return token.user, token
+
+    def get_cached(self, key):
+        user = token_cache.get(key)
+        if user is None:
+            return None
+        # Копия, чтобы изменения в одном запросе не попали в другие.
+        user = copy.copy(user)
+        return user, self.get_model()(key=key, user=user)
@@ -0,0 +1,196 @@
+import base64
+import binascii
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+from recipes.constants import (
+    MAX_IMAGE_PIXELS,
+    MAX_RECIPE_IMAGE_SIZE,
+    RECIPE_IMAGE_FORMATS,
+)
+from recipes.images import EXTENSIONS, variant_url, variant_urls
+from users.validators import image_format, read_head
+
+# Ключ контекста сериализатора с заранее загруженными объектами:
+# {модель: {pk: объект}}.
+BULK_OBJECTS = 'bulk_objects'
+
+
+def resolve_in_bulk(context, queryset, values):
+    """
+    Загружает объекты queryset по всем id из values одним IN-запросом
+    и кладет их в контекст для BulkPrimaryKeyRelatedField.
+    Некорректные id пропускаются: ошибку по ним выдаст само поле.
+    """
+    pks = set()
+    for value in values:
+        if isinstance(value, bool):
+            continue
+        try:
+            pks.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    objects = context.setdefault(BULK_OBJECTS, {}).setdefault(
+        queryset.model, {})
+    objects.update(queryset.in_bulk(pks - objects.keys()))
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, который берет объекты из загруженных
+    заранее через resolve_in_bulk, а не делает запрос на каждый id.
+    Ошибки по неизвестным id, как и раньше, выдаются для каждого
+    элемента. Без загруженных объектов поле работает как обычное.
+    """
+
+    def to_internal_value(self, data):
+        objects = self.context.get(BULK_OBJECTS, {}).get(
+            self.get_queryset().model)
+        if objects is None:
+            return super().to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in objects:
+            self.fail('does_not_exist', pk_value=data)
+        return objects[pk]
+
+
+class ImageVariantField(serializers.ReadOnlyField):
+    """
+    URL варианта картинки объекта (recipes.images),
+    пока вариант не построен - URL оригинала.
+    """
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def absolute(self, url):
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, instance):
+        return self.absolute(variant_url(instance, self.variant))
+
+
+class ImageVariantsField(ImageVariantField):
+    """Все варианты картинки: {вариант: URL}."""
+
+    def __init__(self, **kwargs):
+        super().__init__(variant=None, **kwargs)
+
+    def to_representation(self, instance):
+        return {variant: self.absolute(url)
+                for variant, url in variant_urls(instance).items()}
+
+
+class StreamingImageField(serializers.ImageField):
+    """
+    Картинка из multipart-загрузки (файл уже на диске или в памяти,
+    см. FILE_UPLOAD_HANDLERS и api.parsers) или из строки base64,
+    в том числе data URI.
+
+    base64 декодируется частями во временный файл, без полной копии
+    в памяти. Размер проверяется по длине строки до декодирования,
+    формат - по магическим байтам первой части, размер в пикселях -
+    по заголовку картинки. Пиксели целиком не декодируются.
+    """
+
+    BASE64_CHUNK = 64 * 1024
+    default_error_messages = {
+        'invalid_image': 'Загрузите картинку в формате {formats}.',
+        'invalid_base64': 'Некорректная строка base64.',
+        'too_large': 'Размер файла не должен превышать {max_size} МБ.',
+        'too_many_pixels': 'Картинка не должна быть больше '
+                           '{max_pixels} пикселей.',
+    }
+
+    def __init__(self, max_size=MAX_RECIPE_IMAGE_SIZE,
+                 formats=RECIPE_IMAGE_FORMATS, **kwargs):
+        self.max_size = max_size
+        self.formats = formats
+        super().__init__(**kwargs)
+
+    def fail_format(self):
+        self.fail('invalid_image', formats=', '.join(self.formats))
+
+    def check_size(self, size):
+        if size > self.max_size * 1024 * 1024:
+            self.fail('too_large', max_size=self.max_size)
+
+    def decode_base64(self, data):
+        start = data.find(';base64,')
+        start = 0 if start == -1 else start + len(';base64,')
+        # Три байта на каждые четыре символа.
+        self.check_size((len(data) - start) // 4 * 3 - 2)
+        # Безымянный временный файл удаляется при закрытии.
+        file = File(tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR),
+                    name='upload')
+        carry = ''
+        for offset in range(start, len(data), self.BASE64_CHUNK):
+            chunk = carry + ''.join(
+                data[offset:offset + self.BASE64_CHUNK].split())
+            usable = len(chunk) - len(chunk) % 4
+            carry = chunk[usable:]
+            self.write_base64(file, chunk[:usable])
+        if carry:
+            self.write_base64(file, carry + '=' * (-len(carry) % 4))
+        file.size = file.tell()
+        return file
+
+    def write_base64(self, file, chunk):
+        try:
+            decoded = base64.b64decode(chunk, validate=True)
+        except (binascii.Error, ValueError):
+            self.fail('invalid_base64')
+        if not file.tell() and image_format(decoded) not in self.formats:
+            self.fail_format()
+        file.write(decoded)
+
+    def probe(self, file):
+        """Проверка формата и размеров по заголовку картинки."""
+        detected = image_format(read_head(file))
+        if detected not in self.formats:
+            self.fail_format()
+        self.check_size(file.size)
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+                if image.format != detected:
+                    self.fail_format()
+                if width * height > MAX_IMAGE_PIXELS:
+                    self.fail('too_many_pixels', max_pixels=MAX_IMAGE_PIXELS)
+                # Проверка целостности без декодирования пикселей.
+                image.verify()
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError):
+            self.fail_format()
+        file.seek(0)
+        return detected
+
+    def to_internal_value(self, data):
+        if data in ('', None):
+            return None
+        if isinstance(data, str):
+            file = self.decode_base64(data)
+        elif isinstance(data, (UploadedFile, File)):
+            file = data
+        else:
+            self.fail_format()
+        detected = self.probe(file)
+        file.name = f'{uuid.uuid4()}.{EXTENSIONS[detected]}'
+        return file
@@ -1,19 +1,39 @@
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
+from django_filters.fields import MultipleChoiceField
+from rest_framework.filters import OrderingFilter
 
-from recipes.models import Recipe, Tag
+from recipes.constants import SEARCH, TRENDING
+from recipes.facets import has_tags
+from recipes.fulltext import search_recipes
+from recipes.models import Favorite, Recipe, ShoppingList
+from recipes.tags import tag_cache, tag_choices
 from users.models import User
 
 
-class NameSearchFilter(SearchFilter):
-    # Переопределяем параметр поиска ингредиента.
-    search_param = 'name'
+class TagSlugsField(MultipleChoiceField):
+    """Слаги проверяются по кэшу тегов, неизвестные - по базе."""
+
+    def valid_value(self, value):
+        return tag_cache.knows(value)
+
+
+class TagsFilter(filters.MultipleChoiceFilter):
+    field_class = TagSlugsField
 
 
 class ExtraParamsFilter(filters.FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(field_name='tags__slug',
-                                             to_field_name='slug',
-                                             queryset=Tag.objects.all())
+    """
+    Фильтры списка рецептов. Теги и флаги пользователя проверяются
+    подзапросами (полусоединение), а не соединением таблиц: строки
+    рецептов не размножаются, и DISTINCT не нужен.
+    Теги - EXISTS по связям рецепта: подходит большая часть рецептов.
+    Избранное и список покупок - IN по строкам пользователя: их мало,
+    и поиск удобнее начинать с них.
+    """
+
+    tags = TagsFilter(choices=tag_choices,
+                      method='get_tags_filter',
+                      label='Теги')
     is_favorited = filters.BooleanFilter(method='get_favorited_filter',
                                          label='В Избранном')
     is_in_shopping_cart = filters.BooleanFilter(
@@ -25,19 +45,48 @@ class ExtraParamsFilter(filters.FilterSet):
         field_name='author',
         label='Авторы'
     )
+    search = filters.CharFilter(method='get_search_filter',
+                                label='Поиск по названию и описанию')
+
+    def get_tags_filter(self, queryset, name, value):
+        ids = tag_cache.ids()
+        return queryset.filter(
+            has_tags([ids[slug] for slug in value if slug in ids]))
 
     def get_favorited_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorite__user=user)
+            return queryset.filter(pk__in=Favorite.objects.filter(
+                user=user).values('recipe_id'))
         return queryset
 
     def get_shopping_cart_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(shoppinglist__user=user)
+            return queryset.filter(pk__in=ShoppingList.objects.filter(
+                user=user).values('recipe_id'))
         return queryset
 
+    def get_search_filter(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """
+    Сортировка по полям ordering_fields вьюсета и по рейтингу
+    «в тренде»: ?ordering=trending (recipes.trending).
+    Результаты поиска ?search= без ?ordering= идут по релевантности.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if params and params.strip() == TRENDING:
+            return ('-trending_score', '-id')
+        if not params and request.query_params.get(SEARCH, '').strip():
+            return ('-search_rank', '-id')
+        return super().get_ordering(request, queryset, view)
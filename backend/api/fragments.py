@@ -0,0 +1,157 @@
+# Кэш представлений рецептов.
+#
+# Автор, теги, ингредиенты, текст и картинка рецепта одинаковы для всех
+# юзеров: эта часть (фрагмент) сериализуется один раз и хранится в кэше
+# Django по id рецепта. Ключ включает время изменения рецепта (updated)
+# и версии тегов и ингредиентов, так что их изменение сразу делает
+# фрагменты устаревшими. Фрагмент кладется под ключ с updated рецепта,
+# прочитанным вместе с его связями: данные под ключом не старше ключа,
+# даже если рецепт изменили, пока фрагмент строился. Правки тегов,
+# ингредиентов и картинки рецепта меняют updated (api.signals,
+# recipes.images). Флаги юзера
+# (is_favorited, is_in_shopping_cart, author.is_subscribed) берутся из
+# аннотаций запроса страницы и накладываются на фрагмент при выдаче.
+# Сброс фрагментов по сигналам моделей - в api.signals.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from api.serializers import (
+    RecipeFragmentSerializer,
+    RecipeReadSerializer,
+    UserSerializer,
+)
+from recipes.models import Recipe
+from recipes.versioning import (
+    INGREDIENTS,
+    TAGS,
+    aget_data_versions,
+    get_data_versions,
+)
+
+# Номер формата фрагмента меняется вместе с набором его полей.
+FRAGMENT_KEY = 'recipe-fragment:3:{tags}:{ingredients}:{pk}:{updated}'
+
+
+def get_cache():
+    return caches[settings.RECIPE_FRAGMENT_CACHE]
+
+
+def fragment_keys(recipes, versions=None):
+    """
+    Ключи фрагментов {id рецепта: ключ}; versions - версии тегов
+    и ингредиентов.
+    """
+    if versions is None:
+        versions = get_data_versions()
+    return {
+        recipe.pk: FRAGMENT_KEY.format(
+            tags=versions.get(TAGS, 0),
+            ingredients=versions.get(INGREDIENTS, 0),
+            pk=recipe.pk,
+            updated=int(recipe.updated.timestamp() * 1_000_000))
+        for recipe in recipes
+    }
+
+
+def get_fragments(recipes):
+    """Фрагменты рецептов из кэша; недостающие сериализуются и кэшируются."""
+    versions = get_data_versions()
+    keys = fragment_keys(recipes, versions)
+    fragments = cached_fragments(keys, get_cache().get_many(keys.values()))
+    missing = [pk for pk in keys if pk not in fragments]
+    if missing:
+        fragments.update(build_fragments(missing, versions))
+    return fragments
+
+
+async def aget_fragments(recipes):
+    """get_fragments для асинхронных вью."""
+    versions = await aget_data_versions()
+    keys = fragment_keys(recipes, versions)
+    # В Django 4.2 aget_many кэша - sync_to_async на каждый ключ,
+    # обращение к кэшу без перехода в поток дешевле.
+    fragments = cached_fragments(keys, get_cache().get_many(keys.values()))
+    missing = [pk for pk in keys if pk not in fragments]
+    if missing:
+        # prefetch_related в async ORM Django 4.2 не поддерживается.
+        fragments.update(
+            await sync_to_async(build_fragments)(missing, versions))
+    return fragments
+
+
+def cached_fragments(keys, cached):
+    return {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+
+def build_fragments(recipe_ids, versions):
+    recipes = list(
+        Recipe.objects.with_relations().filter(pk__in=recipe_ids))
+    # Ключи по updated из этого же запроса, а не со страницы.
+    keys = fragment_keys(recipes, versions)
+    fresh = {recipe.pk: RecipeFragmentSerializer(recipe).data
+             for recipe in recipes}
+    get_cache().set_many({keys[pk]: data for pk, data in fresh.items()},
+                         settings.RECIPE_FRAGMENT_TIMEOUT)
+    return fresh
+
+
+def absolute_url(request, url):
+    return request.build_absolute_uri(url) if url else url
+
+
+def absolute_urls(request, urls):
+    return {name: absolute_url(request, url) for name, url in urls.items()}
+
+
+def overlay(fragment, recipe, request):
+    """Представление рецепта для юзера: фрагмент плюс его флаги."""
+    author = fragment['author']
+    author = dict(author,
+                  is_subscribed=recipe.author_is_subscribed,
+                  avatar=absolute_url(request, author['avatar']),
+                  avatar_variants=absolute_urls(request,
+                                                author['avatar_variants']))
+    data = dict(fragment,
+                author={field: author[field]
+                        for field in UserSerializer.Meta.fields},
+                image=absolute_url(request, fragment['image']),
+                image_variants=absolute_urls(request,
+                                             fragment['image_variants']),
+                is_favorited=recipe.is_favorited,
+                is_in_shopping_cart=recipe.is_in_shopping_cart)
+    # Порядок полей как у RecipeReadSerializer.
+    return {field: data[field] for field in RecipeReadSerializer.Meta.fields}
+
+
+def render_recipes(recipes, request):
+    """
+    Представления рецептов как у RecipeReadSerializer.
+    Рецепты должны быть аннотированы флагами юзера: см.
+    RecipeQuerySet.with_user_flags и with_author_subscription.
+    """
+    fragments = get_fragments(recipes)
+    return overlay_all(fragments, recipes, request)
+
+
+async def arender_recipes(recipes, request):
+    """render_recipes для асинхронных вью."""
+    fragments = await aget_fragments(recipes)
+    return overlay_all(fragments, recipes, request)
+
+
+def overlay_all(fragments, recipes, request):
+    return [overlay(fragments[recipe.pk], recipe, request)
+            for recipe in recipes if recipe.pk in fragments]
+
+
+def invalidate_recipes(recipes):
+    """
+    Сбрасывает фрагменты рецептов (с загруженным updated)
+    после фиксации транзакции.
+    """
+    recipes = list(recipes)
+    if recipes:
+        transaction.on_commit(lambda: get_cache().delete_many(
+            fragment_keys(recipes).values()))
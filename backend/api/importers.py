@@ -0,0 +1,120 @@
+# Массовый импорт рецептов (API и manage.py import_recipes).
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+
+from api.fields import resolve_in_bulk
+from api.serializers import RecipeCreateSerializer
+from recipes.constants import RECIPE_IMPORT_CHUNK_SIZE
+from recipes.counters import change_counter
+from recipes.feed import schedule_fan_out
+from recipes.images import schedule_variants
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+class RecipeImporter:
+    """
+    Импорт рецептов пачками.
+
+    Записи каждой пачки валидируются RecipeCreateSerializer вместе:
+    все ингредиенты и теги пачки загружаются двумя IN-запросами.
+    Валидные рецепты пачки вставляются bulk_create в одной транзакции.
+    Ошибки записей собираются с номерами записей и не прерывают импорт.
+    """
+
+    def __init__(self, author, chunk_size=RECIPE_IMPORT_CHUNK_SIZE):
+        self.author = author
+        self.chunk_size = chunk_size
+        self.created = []
+        self.errors = []
+
+    def run(self, records):
+        """Импортирует записи: итерируемое пар (номер, данные рецепта)."""
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+        return {'created': self.created, 'errors': self.errors}
+
+    def validate_chunk(self, chunk):
+        context = {}
+        records = [(number, data) for number, data in chunk
+                   if isinstance(data, dict)]
+        ingredient_ids = []
+        tag_ids = []
+        for _, data in records:
+            ingredients = data.get('ingredients')
+            tags = data.get('tags')
+            if isinstance(ingredients, list):
+                ingredient_ids.extend(item.get('id') for item in ingredients
+                                      if isinstance(item, dict))
+            if isinstance(tags, list):
+                tag_ids.extend(tags)
+        resolve_in_bulk(context, Ingredient.objects.all(), ingredient_ids)
+        resolve_in_bulk(context, Tag.objects.all(), tag_ids)
+        valid = []
+        for number, data in chunk:
+            if not isinstance(data, dict):
+                self.errors.append({'record': number,
+                                    'errors': 'Ожидается объект рецепта.'})
+                continue
+            serializer = RecipeCreateSerializer(data=data, context=context)
+            if serializer.is_valid():
+                valid.append((number, serializer.validated_data))
+            else:
+                self.errors.append({'record': number,
+                                    'errors': serializer.errors})
+        return valid
+
+    def import_chunk(self, chunk):
+        valid = self.validate_chunk(chunk)
+        if not valid:
+            return
+        try:
+            with transaction.atomic():
+                self.created.extend(self.insert(valid))
+        except DatabaseError:
+            # Найдем записи, из-за которых не прошла вставка пачки:
+            # вставим их по одной, каждую в своей транзакции.
+            for record in valid:
+                try:
+                    with transaction.atomic():
+                        self.created.extend(self.insert([record]))
+                except DatabaseError as error:
+                    self.errors.append({'record': record[0],
+                                        'errors': str(error)})
+
+    def insert(self, valid):
+        recipes = [
+            Recipe(
+                author=self.author,
+                name=data['name'],
+                text=data['text'],
+                image=data['image'],
+                cooking_time=data['cooking_time'],
+            )
+            for _, data in valid
+        ]
+        Recipe.objects.bulk_create(recipes)
+        lines = []
+        tag_links = []
+        TagLink = Recipe.tags.through
+        for recipe, (_, data) in zip(recipes, valid):
+            lines.extend(
+                RecipeIngredient(recipe=recipe,
+                                 ingredient=item['ingredient'],
+                                 amount=item['amount'])
+                for item in data['ingredients']
+            )
+            tag_links.extend(TagLink(recipe=recipe, tag=tag)
+                             for tag in data['tags'])
+            # bulk_create не посылает post_save.
+            schedule_variants(recipe)
+        RecipeIngredient.objects.bulk_create(lines)
+        TagLink.objects.bulk_create(tag_links)
+        change_counter(User, self.author.pk, 'recipes_count', len(recipes))
+        schedule_fan_out(self.author.pk, [recipe.id for recipe in recipes])
+        return [recipe.id for recipe in recipes]
@@ -0,0 +1,103 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from api.fragments import render_recipes
+from api.utils import percentile
+from recipes.feed import fan_out, feed_recipes, joined_feed_recipes
+from recipes.models import Recipe
+from users.models import User
+
+PERCENTILES = (50, 95)
+
+
+class FakeRequest:
+    """Запрос для render_recipes без HTTP."""
+
+    def __init__(self, user):
+        self.user = user
+
+    def build_absolute_uri(self, location):
+        return location
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает чтение ленты подписок из TimelineEntry '
+            '(fan-out on write) с соединением рецептов и подписок '
+            '(fan-out on read), а также стоимость раскладки рецепта.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, default=None,
+                            help='id читателя (по умолчанию - с наибольшим '
+                                 'числом подписок).')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Число повторов каждого запроса.')
+        parser.add_argument('--limit', type=int, default=6,
+                            help='Размер страницы ленты.')
+        parser.add_argument('--page', type=int, default=1,
+                            help='Номер страницы ленты.')
+
+    def get_user(self, pk):
+        users = User.objects.all()
+        if pk is None:
+            users = (users.annotate(follows=Count('follower'))
+                     .order_by('-follows'))
+        else:
+            users = users.filter(pk=pk)
+        user = users.first()
+        if user is None:
+            raise CommandError('Читатель не найден.')
+        return user
+
+    def measure(self, name, build_queryset, user, options):
+        offset = (options['page'] - 1) * options['limit']
+        request = FakeRequest(user)
+        timings = []
+        for _ in range(options['repeat']):
+            # Журнал запросов ограничен: считаем запросы одного повтора.
+            reset_queries()
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                queryset = (build_queryset(
+                    user,
+                    Recipe.objects.with_user_flags(user)
+                    .with_author_subscription(user))
+                    .order_by('-id'))
+                total = queryset.count()
+                page = list(queryset[offset:offset + options['limit']])
+            timings.append((time.perf_counter() - started) * 1000)
+        # Отрисовка страницы одинакова для обеих стратегий и не замеряется.
+        render_recipes(page, request)
+        values = ' '.join(f'p{percent}={percentile(timings, percent):.1f}мс'
+                          for percent in PERCENTILES)
+        self.stdout.write(f'{name:<16} рецептов={total:<6} '
+                          f'запросов={len(queries)} {values}')
+        return [recipe.pk for recipe in page]
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        follows = user.follower.count()
+        self.stdout.write(f'Читатель {user.pk}: подписок {follows}.')
+        timeline = self.measure('timeline', feed_recipes, user, options)
+        joined = self.measure('join', joined_feed_recipes, user, options)
+        if timeline != joined:
+            self.stdout.write(self.style.WARNING(
+                'Страницы различаются: ленты усечены (trim_feeds) или '
+                'не заполнены для старых рецептов.'))
+        author = (User.objects.filter(recipes__isnull=False)
+                  .order_by('-followers_count').first())
+        if author is None:
+            return
+        recipe_ids = list(author.recipes.values_list('id', flat=True)[:1])
+        with transaction.atomic():
+            started = time.perf_counter()
+            created = fan_out(author.pk, recipe_ids)
+            elapsed = (time.perf_counter() - started) * 1000
+            transaction.set_rollback(True)
+        self.stdout.write(
+            f'Раскладка рецепта автора {author.pk} '
+            f'({author.followers_count} подписчиков): '
+            f'записей {created}, {elapsed:.1f} мс.')
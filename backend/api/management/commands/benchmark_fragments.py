@@ -0,0 +1,99 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from api.fragments import fragment_keys, get_cache, render_recipes
+from api.utils import percentile
+from recipes.models import Recipe
+from users.models import User
+
+PERCENTILES = (50, 95)
+
+
+class FakeRequest:
+    """Запрос для render_recipes без HTTP."""
+
+    def __init__(self, user):
+        self.user = user
+
+    def build_absolute_uri(self, location):
+        return location
+
+
+class Command(BaseCommand):
+    help = ('Замеряет страницы списка рецептов с кэшем фрагментов '
+            '(api.fragments) и без него: доля попаданий в кэш, число '
+            'запросов и p50/p95 на страницу.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, default=None,
+                            help='id читателя (по умолчанию - первый).')
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Число запрошенных страниц.')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Размер страницы.')
+        parser.add_argument('--pages', type=int, default=10,
+                            help='Число разных страниц.')
+        parser.add_argument('--edit-every', type=int, default=0,
+                            help='Отмечать случайный рецепт страницы '
+                                 'измененным каждые N страниц (0 - нет).')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно выбора страниц и правок.')
+
+    def get_user(self, pk):
+        users = User.objects.order_by('id')
+        if pk is not None:
+            users = users.filter(pk=pk)
+        user = users.first()
+        if user is None:
+            raise CommandError('Читатель не найден.')
+        return user
+
+    def measure(self, name, user, options, flush):
+        rng = random.Random(options['seed'])
+        request = FakeRequest(user)
+        limit = options['limit']
+        queryset = (Recipe.objects.with_user_flags(user)
+                    .with_author_subscription(user).order_by('-id'))
+        timings = []
+        hits = total = queries = 0
+        for number in range(options['repeat']):
+            if flush:
+                get_cache().clear()
+            offset = rng.randrange(options['pages']) * limit
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                page = list(queryset[offset:offset + limit])
+                elapsed = time.perf_counter() - started
+                # Подсчет попаданий в замер не входит.
+                hits += len(get_cache().get_many(
+                    fragment_keys(page).values()))
+                started = time.perf_counter()
+                render_recipes(page, request)
+                elapsed += time.perf_counter() - started
+            timings.append(elapsed * 1000)
+            total += len(page)
+            queries += len(captured)
+            edit_every = options['edit_every']
+            if page and edit_every and number % edit_every == 0:
+                Recipe.objects.filter(pk=rng.choice(page).pk).touch()
+        values = ' '.join(f'p{percent}={percentile(timings, percent):.1f}мс'
+                          for percent in PERCENTILES)
+        self.stdout.write(
+            f'{name:<8} попаданий={hits / max(total, 1):.1%} '
+            f'запросов={queries / options["repeat"]:.1f} {values}')
+
+    def handle(self, *args, **options):
+        if not Recipe.objects.exists():
+            raise CommandError('Нужны рецепты в базе.')
+        user = self.get_user(options['user'])
+        self.stdout.write(f'Читатель {user.pk}, страниц по '
+                          f'{options["limit"]} рецептов: {options["pages"]}.')
+        self.measure('без кэша', user, options, flush=True)
+        # Первый проход прогревает кэш, второй замеряется.
+        self.measure('прогрев', user, options, flush=False)
+        self.measure('с кэшем', user, options, flush=False)
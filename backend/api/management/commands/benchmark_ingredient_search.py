@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.serializers import IngredientSerializer
+from api.utils import percentile
+from recipes.models import Ingredient
+from recipes.search import ingredient_index
+
+PERCENTILES = (50, 95)
+# Типичные запросы автодополнения: начала названий разной длины.
+PREFIXES = ('к', 'мо', 'сах', 'соль', 'тома', 'яйц', 'мука пш')
+
+
+def orm_search(prefix, limit):
+    """Прежний поиск: SearchFilter с '^name' (istartswith) и сериализатор."""
+    queryset = Ingredient.objects.filter(name__istartswith=prefix)
+    if limit is not None:
+        queryset = queryset[:limit]
+    return IngredientSerializer(queryset, many=True).data
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск ингредиентов по началу названия через ORM '
+            '(istartswith и сериализатор) с индексом в памяти '
+            '(recipes.search). Печатает p50/p95 на запрос.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('prefixes', nargs='*', default=PREFIXES,
+                            help='Запросы (по умолчанию - типичные).')
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Число повторов каждого запроса.')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Ограничение числа результатов.')
+
+    def measure(self, name, search, options):
+        timings = []
+        found = 0
+        for _ in range(options['repeat']):
+            for prefix in options['prefixes']:
+                started = time.perf_counter()
+                result = search(prefix, options['limit'])
+                timings.append((time.perf_counter() - started) * 1000)
+                found += len(result)
+        values = ' '.join(f'p{percent}={percentile(timings, percent):.3f}мс'
+                          for percent in PERCENTILES)
+        self.stdout.write(f'{name:<6} найдено={found // options["repeat"]:<6} '
+                          f'{values}')
+
+    def handle(self, *args, **options):
+        total = Ingredient.objects.count()
+        if not total:
+            raise CommandError('Справочник ингредиентов пуст.')
+        self.stdout.write(f'Ингредиентов: {total}, запросов: '
+                          f'{len(options["prefixes"])}.')
+        # Индекс строится один раз на воркер: в замер не входит.
+        ingredient_index.refresh()
+        self.measure('orm', orm_search, options)
+        self.measure('index', ingredient_index.search, options)
+        self.stdout.write('Индекс находит и совпадения по началу слов '
+                          'и похожие названия, поэтому найденного больше.')
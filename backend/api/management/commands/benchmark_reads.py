@@ -0,0 +1,137 @@
+import asyncio
+import random
+import socket
+import time
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils import percentile
+from recipes.models import Ingredient, Recipe
+
+PERCENTILES = (50, 95, 99)
+READ_CHUNK = 4096
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест запросов на чтение к запущенному серверу '
+            '(gunicorn с foodgram.wsgi или с UvicornWorker и foodgram.asgi) '
+            'медленными клиентами. Печатает RPS и p50/p95/p99.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Адрес сервера.')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Число одновременных клиентов.')
+        parser.add_argument('--duration', type=float, default=20,
+                            help='Длительность теста в секундах.')
+        parser.add_argument(
+            '--client-delay', type=float, default=0.05,
+            help='Задержка клиента в секундах: перед концом запроса '
+                 'и между чтениями каждых 4 КБ ответа.')
+        parser.add_argument('--token', default=None,
+                            help='Токен пользователя для заголовка '
+                                 'Authorization.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно выбора запросов.')
+
+    def get_paths(self):
+        """Набор запросов: те же эндпоинты, что у асинхронных вью."""
+        recipes = list(Recipe.objects.order_by('id')[:50])
+        names = list(Ingredient.objects.order_by('id')
+                     .values_list('name', flat=True)[:50])
+        if not recipes or not names:
+            raise CommandError('Нужны рецепты и ингредиенты в базе.')
+        return {
+            'recipes': ['/api/recipes/?page=1&limit=6',
+                        '/api/recipes/?page=2&limit=6'],
+            'recipe': [f'/api/recipes/{recipe.pk}/' for recipe in recipes],
+            'tags': ['/api/tags/'],
+            # Весь справочник: ответ больше буферов сокета.
+            'all-ingr': ['/api/ingredients/'],
+            'ingredients': [f'/api/ingredients/?name={quote(name[:3])}'
+                            for name in names],
+            'short-link': [f'/s/{recipe.short_url_code}/'
+                           for recipe in recipes],
+        }
+
+    async def connect(self, host, port):
+        """
+        Соединение с маленьким буфером приема: сервер не может сразу
+        отдать ответ в буфер ядра и ждет, пока клиент его прочитает.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, READ_CHUNK)
+        sock.setblocking(False)
+        try:
+            await asyncio.get_running_loop().sock_connect(sock, (host, port))
+        except OSError:
+            sock.close()
+            raise
+        return await asyncio.open_connection(sock=sock, limit=READ_CHUNK)
+
+    async def fetch(self, host, port, path):
+        """Один запрос по HTTP/1.1 от медленного клиента."""
+        reader, writer = await self.connect(host, port)
+        try:
+            head = (f'GET {path} HTTP/1.1\r\nHost: {host}\r\n'
+                    f'Connection: close\r\n{self.auth_header}')
+            writer.write(head.encode())
+            await writer.drain()
+            await asyncio.sleep(self.client_delay)
+            writer.write(b'\r\n')
+            await writer.drain()
+            status_line = await reader.readline()
+            while await reader.read(READ_CHUNK):
+                await asyncio.sleep(self.client_delay)
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+
+    async def client(self, host, port, paths, rng, deadline, results):
+        while time.monotonic() < deadline:
+            group = rng.choice(list(paths))
+            path = rng.choice(paths[group])
+            started = time.monotonic()
+            try:
+                status = await self.fetch(host, port, path)
+            except (OSError, IndexError, ValueError):
+                status = None
+            results.append((group, status, time.monotonic() - started))
+
+    async def run(self, host, port, paths, options):
+        results = []
+        deadline = time.monotonic() + options['duration']
+        await asyncio.gather(*(
+            self.client(host, port, paths,
+                        random.Random(options['seed'] + number),
+                        deadline, results)
+            for number in range(options['concurrency'])
+        ))
+        return results
+
+    def report(self, name, results, elapsed):
+        latencies = [latency * 1000 for _, status, latency in results
+                     if status is not None and status < 500]
+        errors = len(results) - len(latencies)
+        values = ' '.join(
+            f'p{percent}={percentile(latencies, percent):.0f}мс'
+            for percent in PERCENTILES)
+        self.stdout.write(
+            f'{name:<12} запросов={len(results):<6} ошибок={errors:<4} '
+            f'RPS={len(latencies) / elapsed:<7.1f} {values}')
+
+    def handle(self, *args, **options):
+        address = urlsplit(options['url'])
+        self.client_delay = options['client_delay']
+        self.auth_header = (f'Authorization: Token {options["token"]}\r\n'
+                            if options['token'] else '')
+        paths = self.get_paths()
+        started = time.monotonic()
+        results = asyncio.run(self.run(address.hostname,
+                                       address.port or 80, paths, options))
+        elapsed = time.monotonic() - started
+        for group in paths:
+            self.report(group, [result for result in results
+                                if result[0] == group], elapsed)
+        self.report('всего', results, elapsed)
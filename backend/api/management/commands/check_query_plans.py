@@ -0,0 +1,307 @@
+import random
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import RecipeViewSet, UserViewSet
+from recipes.constants import PAGE_SIZE
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCartIngredient,
+    ShoppingList,
+    Favorite,
+    Tag,
+    TimelineEntry,
+)
+from users.models import Follow, User
+
+# Признаки полного прохода по таблице и сортировки в плане запроса.
+# В SQLite подзапросы в плане названы псевдонимами (U0), поэтому
+# проверяется любой полный проход, кроме разрешенных явно.
+# Проход по индексу (упорядоченный, с LIMIT) допустим, если это
+# ожидаемый индекс проверки.
+FULL_SCAN = {
+    'sqlite': re.compile(r'\bSCAN (\w+)(.*)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)(.*)'),
+}
+SORT = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (\w+ )*ORDER BY'),
+    'postgresql': re.compile(r'^[ >-]*(Incremental )?Sort$', re.MULTILINE),
+}
+# Проходы SQLite не по таблицам: готовые подзапросы и одна строка.
+SQLITE_NOT_TABLES = ('subquery', 'CONSTANT')
+# Таблицу меньше стольких строк планировщик вправе читать целиком
+# (например, users_user для hash join в подписках): такой проход -
+# предупреждение, а не ошибка.
+SMALL_TABLE_ROWS = 2000
+
+
+class Check:
+    """
+    Горячий запрос и требования к его плану.
+    scans - таблицы, полный проход по которым допустим (по первичному
+    ключу в порядке сортировки, с LIMIT); index - индекс, который
+    должен быть в плане; sort - допустима ли сортировка (небольшого
+    числа строк одного юзера).
+    """
+
+    def __init__(self, name, build, scans=(), index=None, sort=False):
+        self.name = name
+        self.build = build
+        self.scans = scans
+        self.index = index
+        self.sort = sort
+
+    def problems(self, plan, vendor, small_tables=()):
+        """
+        Проблемы плана и предупреждения: полные проходы по таблицам
+        из small_tables.
+        """
+        found = []
+        warnings = []
+        for table, details in FULL_SCAN[vendor].findall(plan):
+            if (table in self.scans or table in SQLITE_NOT_TABLES
+                    or (self.index and self.index in details)):
+                continue
+            if table in small_tables:
+                warnings.append(f'полный проход по маленькой таблице {table}')
+            else:
+                found.append(f'полный проход по {table}')
+        if not self.sort and SORT[vendor].search(plan):
+            found.append('сортировка')
+        if self.index and self.index not in plan:
+            found.append(f'не использован индекс {self.index}')
+        return found, warnings
+
+
+def viewset(viewset_class, action, user, params=None):
+    """Вьюсет, готовый строить запросы для action, без HTTP."""
+    request = APIRequestFactory().get('/', params or {})
+    force_authenticate(request, user=user)
+    view = viewset_class(action_map={'get': action}, format_kwarg=None,
+                         args=(), kwargs={})
+    view.request = view.initialize_request(request)
+    return view
+
+
+def recipe_list(params=None, action='list'):
+    def build(data):
+        view = viewset(RecipeViewSet, action, data['user'], params)
+        return view.filter_queryset(view.get_queryset())[:PAGE_SIZE]
+    return build
+
+
+def subscriptions(data):
+    view = viewset(UserViewSet, 'subscriptions', data['user'])
+    return (view.subscribed_authors(view.request)
+            .filter(following__user=data['user'])
+            .order_by(*view.ordering)[:PAGE_SIZE])
+
+
+# Запросы api/views.py, api/filters.py и api/serializers.py.
+CHECKS = (
+    Check('рецепты', recipe_list(), scans=('recipes_recipe',)),
+    Check('рецепты автора',
+          lambda data: recipe_list({'author': data['author'].pk})(data),
+          index='recipe_author_id_idx'),
+    Check('рецепты по тегам',
+          lambda data: recipe_list({'tags': data['tags']})(data),
+          scans=('recipes_recipe',)),
+    Check('избранное', recipe_list({'is_favorited': 1}), sort=True),
+    Check('список покупок', recipe_list({'is_in_shopping_cart': 1}),
+          sort=True),
+    Check('популярные', recipe_list({'ordering': '-favorites_count'}),
+          index='recipe_favorites_count_idx'),
+    Check('в тренде', recipe_list({'ordering': 'trending'}),
+          index='recipe_trending_score_idx'),
+    # Лента юзера не длиннее FEED_MAX_LENGTH: ее можно сортировать.
+    Check('лента', recipe_list(action='feed'), sort=True),
+    Check('подписки', subscriptions, sort=True),
+    Check('выгрузка списка покупок',
+          lambda data: ShoppingCartIngredient.objects.lines(data['user']),
+          sort=True),
+    # Новые рецепты с ингредиентом - только по индексу, без сортировки.
+    Check('рецепты с ингредиентом',
+          lambda data: RecipeIngredient.objects
+          .filter(ingredient=data['ingredient'])
+          .order_by('-recipe_id')
+          .values_list('recipe_id', flat=True)[:PAGE_SIZE],
+          index='recipeingr_ingredient_idx'),
+    # Строк одного рецепта немного: их можно сортировать.
+    Check('ингредиенты рецепта',
+          lambda data: RecipeIngredient.objects.filter(
+              recipe=data['recipe']).values('ingredient_id', 'amount'),
+          sort=True),
+    # Как exists(): без сортировки, одна строка.
+    Check('подписан ли',
+          lambda data: Follow.objects.filter(
+              user=data['user'], following=data['author']).order_by()[:1]),
+    Check('в избранном ли',
+          lambda data: Favorite.objects.filter(
+              user=data['user'], recipe=data['recipe']).order_by()[:1]),
+)
+
+
+class Command(BaseCommand):
+    help = ('Проверяет планы горячих запросов API (EXPLAIN): нет ли полных '
+            'проходов по таблицам и сортировок там, где ожидается индекс. '
+            'Данные для проверки создаются в транзакции и откатываются. '
+            'Завершается с ошибкой, если план какого-то запроса плох.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000,
+                            help='Сколько рецептов создать.')
+        parser.add_argument('--users', type=int, default=500,
+                            help='Сколько пользователей создать.')
+        parser.add_argument('--existing', action='store_true',
+                            help='Проверить на данных базы, ничего '
+                                 'не создавая. На маленькой базе '
+                                 'полный проход по таблице - законный '
+                                 'выбор планировщика.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора данных.')
+        parser.add_argument('--show-plans', action='store_true',
+                            help='Печатать планы всех запросов.')
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in FULL_SCAN:
+            raise CommandError(f'Планы {vendor} не поддерживаются.')
+        with transaction.atomic():
+            if options['existing']:
+                data = self.existing_data()
+            else:
+                data = self.seed(options)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            failed = self.check_plans(data, vendor, options['show_plans'],
+                                      self.small_tables())
+            transaction.set_rollback(True)
+        if failed:
+            raise CommandError(f'Плохие планы: {", ".join(failed)}.')
+        self.stdout.write(self.style.SUCCESS('Все планы в порядке.'))
+
+    def small_tables(self):
+        """Таблицы меньше SMALL_TABLE_ROWS строк."""
+        small = set()
+        with connection.cursor() as cursor:
+            for table in connection.introspection.table_names(cursor):
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM '
+                    f'{connection.ops.quote_name(table)}')
+                if cursor.fetchone()[0] < SMALL_TABLE_ROWS:
+                    small.add(table)
+        return small
+
+    def check_plans(self, data, vendor, show_plans, small_tables):
+        failed = []
+        for check in CHECKS:
+            queryset = check.build(data)
+            # Без стоимостей план PostgreSQL короче и стабильнее.
+            plan = (queryset.explain(costs=False) if vendor == 'postgresql'
+                    else queryset.explain())
+            problems, warnings = check.problems(plan, vendor, small_tables)
+            if problems:
+                failed.append(check.name)
+                self.stdout.write(self.style.ERROR(
+                    f'{check.name}: {"; ".join(problems)}'))
+            elif warnings:
+                self.stdout.write(self.style.WARNING(
+                    f'{check.name}: {"; ".join(warnings)}'))
+            else:
+                self.stdout.write(f'{check.name}: ок')
+            if problems or warnings or show_plans:
+                self.stdout.write(plan)
+        return failed
+
+    def existing_data(self):
+        user = (User.objects.annotate(follows=Count('follower'))
+                .order_by('-follows').first())
+        author = User.objects.order_by('-recipes_count').first()
+        recipe = Recipe.objects.order_by('-id').first()
+        ingredient = Ingredient.objects.first()
+        if None in (user, author, recipe, ingredient):
+            raise CommandError('В базе нет пользователей, рецептов '
+                               'или ингредиентов.')
+        return {
+            'user': user,
+            'author': author,
+            'recipe': recipe,
+            'ingredient': ingredient,
+            'tags': list(Tag.objects.values_list('slug', flat=True)[:2]),
+        }
+
+    def seed(self, options):
+        """Синтетические данные: рецепты, теги, ингредиенты, подписки."""
+        rng = random.Random(options['seed'])
+        users = User.objects.bulk_create(
+            User(email=f'plan-check-{number}@example.com',
+                 username=f'plan-check-{number}', first_name='План',
+                 last_name='Проверка', password='!')
+            for number in range(options['users']))
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'plan-check-{number}', slug=f'plan-check-{number}')
+            for number in range(12))
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'plan-check-{number}', measurement_unit='г')
+            for number in range(1000))
+        recipes = Recipe.objects.bulk_create(
+            (Recipe(name=f'Рецепт {number}', text='Описание.',
+                    cooking_time=rng.randint(1, 120),
+                    author=rng.choice(users), image='recipes/images/x.png',
+                    favorites_count=rng.randint(0, 100),
+                    trending_score=rng.random())
+             for number in range(options['recipes'])),
+            batch_size=1000)
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe=recipe, tag=tag)
+             for recipe in recipes for tag in rng.sample(tags, 2)),
+            batch_size=5000)
+        RecipeIngredient.objects.bulk_create(
+            (RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                              amount=rng.randint(1, 500))
+             for recipe in recipes
+             for ingredient in rng.sample(ingredients, 5)),
+            batch_size=5000)
+        for model, per_user in ((Favorite, 20), (ShoppingList, 5)):
+            model.objects.bulk_create(
+                (model(user=user, recipe=recipe)
+                 for user in users
+                 for recipe in rng.sample(recipes, per_user)),
+                batch_size=5000)
+        ShoppingCartIngredient.objects.bulk_create(
+            (ShoppingCartIngredient(user_id=user_id,
+                                    ingredient_id=ingredient_id,
+                                    amount=total)
+             for user_id, ingredient_id, total
+             in ShoppingCartIngredient.objects.live_totals().filter(
+                 recipe__shoppinglist__user__in=users)),
+            batch_size=5000)
+        follows = Follow.objects.bulk_create(
+            Follow(user=user, following=author)
+            for user in users
+            for author in rng.sample(users, 11) if author != user)
+        recipes_by_author = {}
+        for recipe in recipes:
+            recipes_by_author.setdefault(recipe.author_id, []).append(
+                recipe.pk)
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=follow.user_id, recipe_id=recipe_id)
+             for follow in follows
+             for recipe_id in recipes_by_author.get(
+                 follow.following_id, ())[-20:]),
+            batch_size=5000)
+        author = max(users, key=lambda user: len(
+            recipes_by_author.get(user.pk, ())))
+        return {
+            'user': users[0],
+            'author': author,
+            'recipe': recipes[-1],
+            'ingredient': ingredients[0],
+            'tags': [tag.slug for tag in tags[:2]],
+        }
@@ -0,0 +1,58 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importers import RecipeImporter
+from recipes.constants import RECIPE_IMPORT_CHUNK_SIZE
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Импортирует рецепты из файла JSONL: по рецепту в формате '
+            'POST /api/recipes/ на строку.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу JSONL.')
+        parser.add_argument(
+            '--author',
+            required=True,
+            help='Email автора, от имени которого создаются рецепты.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=RECIPE_IMPORT_CHUNK_SIZE,
+            help='Сколько рецептов вставлять в одной транзакции.',
+        )
+
+    def read_records(self, path):
+        """Построчно читает файл, не загружая его целиком в память."""
+        with open(path, encoding='utf-8') as file:
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as error:
+                    # Запись-не-объект попадет в отчет об ошибках.
+                    yield number, str(error)
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(email=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["author"]} не найден.')
+        importer = RecipeImporter(author, chunk_size=options['chunk_size'])
+        started = time.monotonic()
+        report = importer.run(self.read_records(options['path']))
+        elapsed = time.monotonic() - started
+        for error in report['errors']:
+            self.stderr.write(f'Строка {error["record"]}: {error["errors"]}')
+        created = len(report['created'])
+        rate = created / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано рецептов: {created}, '
+            f'с ошибками: {len(report["errors"])}, '
+            f'за {elapsed:.1f} с ({rate:.0f} рецептов/с).'))
@@ -0,0 +1,108 @@
+import gzip
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_header_parameters
+from rest_framework.renderers import JSONRenderer
+
+from recipes.versioning import get_data_version
+
+# Готовые ответы воркера: {набор данных: (версия, json, gzip)}.
+PRERENDERED = {}
+
+
+def get_prerendered(name, version):
+    """Готовый ответ для версии данных или None, если его нет."""
+    cached = PRERENDERED.get(name)
+    if cached is None or cached[0] != version:
+        return None
+    return cached
+
+
+def set_prerendered(name, version, data):
+    content = JSONRenderer().render(data)
+    cached = (version, content, gzip.compress(content, mtime=0))
+    PRERENDERED[name] = cached
+    return cached
+
+
+def validators(name, version):
+    # Версия - время изменения данных в наносекундах, она хранится
+    # в базе и одинакова во всех воркерах (recipes.versioning).
+    return f'W/"{name}-{version}"', version // 10 ** 9
+
+
+def not_modified(request, name, version):
+    """Ответ 304, если у клиента актуальная версия, иначе None."""
+    etag, last_modified = validators(name, version)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        add_validators(response, name, version)
+    return response
+
+
+def accepts_gzip(request):
+    """
+    Принимает ли клиент gzip по Accept-Encoding с учетом q:
+    'gzip;q=0' - отказ, '*' относится к не названным кодировкам.
+    """
+    qualities = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, params = parse_header_parameters(item)
+        if not coding:
+            continue
+        try:
+            qualities[coding] = float(params.get('q', 1))
+        except ValueError:
+            qualities[coding] = 0
+    quality = qualities.get('gzip', qualities.get('x-gzip',
+                                                  qualities.get('*', 0)))
+    return quality > 0
+
+
+def prerendered_response(request, name, version, cached):
+    response = HttpResponse(content_type='application/json')
+    _, content, compressed = cached
+    if accepts_gzip(request):
+        response.content = compressed
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response.content = content
+    add_validators(response, name, version)
+    return response
+
+
+def add_validators(response, name, version):
+    etag, last_modified = validators(name, version)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Клиент переспрашивает сервер, но получает 304 без тела.
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ('Accept-Encoding',))
+
+
+class PrerenderedListMixin:
+    """
+    Отдает список справочных данных (теги, ингредиенты) готовыми байтами.
+
+    JSON списка и его gzip-версия строятся один раз на воркер для
+    текущей версии данных data_version (см. recipes.versioning) и
+    перестраиваются после ее смены сигналами моделей.
+    Ответ содержит ETag и Last-Modified, условные GET получают 304.
+    Те же функции использует асинхронный вариант (api.async_views).
+    """
+
+    data_version = None
+
+    def list(self, request, *args, **kwargs):
+        name = self.data_version
+        version = get_data_version(name)
+        response = not_modified(request, name, version)
+        if response is not None:
+            return response
+        cached = get_prerendered(name, version)
+        if cached is None:
+            serializer = self.get_serializer(self.get_queryset(), many=True)
+            cached = set_prerendered(name, version, serializer.data)
+        return prerendered_response(request, name, version, cached)
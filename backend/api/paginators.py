@@ -1,6 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
-from recipes.constants import LIMIT, MAX_PAGE_SIZE, PAGE_SIZE
+from recipes.constants import (
+    CURSOR,
+    LIMIT,
+    MAX_PAGE_SIZE,
+    PAGE_SIZE,
+    PAGINATION,
+)
 
 
 class PageOrLimitPagination(PageNumberPagination):
@@ -9,3 +15,44 @@ class PageOrLimitPagination(PageNumberPagination):
     page_size = PAGE_SIZE
     max_page_size = MAX_PAGE_SIZE
     page_size_query_param = LIMIT
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    Пагинация по курсору (keyset) с поддержкой limit.
+    Не выполняет COUNT(*) и не использует OFFSET для глубоких страниц.
+    Сортировка берется из атрибута ordering вьюсета (у нас '-id').
+    """
+
+    page_size = PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+    page_size_query_param = LIMIT
+    cursor_query_param = CURSOR
+    ordering = '-id'
+
+
+class PageOrCursorPagination(PageOrLimitPagination):
+    """
+    Постраничная пагинация по умолчанию (ее ожидает фронтенд),
+    и пагинация по курсору по запросу:
+    ?pagination=cursor или наличие параметра ?cursor=.
+    """
+
+    cursor_pagination_class = LimitCursorPagination
+
+    def use_cursor(self, request):
+        return (request.query_params.get(PAGINATION) == CURSOR
+                or CURSOR in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,46 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+# Часть multipart-запроса с полями в формате JSON.
+JSON_PART = 'data'
+
+
+class JSONPartData(dict):
+    """
+    Поля из части 'data'. Request DRF добавляет к ним файлы через
+    copy() и update(): здесь в поля попадают сами файлы, а не их списки.
+    """
+
+    def copy(self):
+        return JSONPartData(self)
+
+    def update(self, other=(), **kwargs):
+        if isinstance(other, MultiValueDict):
+            other = other.dict()
+        super().update(other, **kwargs)
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """
+    multipart/form-data, в котором картинка передается файлом,
+    а остальные поля - JSON-строкой в части 'data' (вложенные списки
+    ingredients и tags в обычной форме не передать).
+    Файлы Django пишет на диск по частям, не держа их в памяти.
+    Без части 'data' работает как обычный MultiPartParser.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        if JSON_PART not in result.data:
+            return result
+        try:
+            data = json.loads(result.data[JSON_PART])
+        except ValueError as error:
+            raise ParseError(f'Некорректный JSON в части {JSON_PART}: '
+                             f'{error}')
+        if not isinstance(data, dict):
+            raise ParseError(f'В части {JSON_PART} ожидается объект JSON.')
+        return DataAndFiles(JSONPartData(data), result.files)
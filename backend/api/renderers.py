@@ -0,0 +1,26 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class TextRenderer(BaseRenderer):
+    """
+    Базовый рендерер текстовых файлов.
+    Сами файлы отдаются потоком (StreamingHttpResponse), через рендерер
+    проходят только ответы с ошибками: выводим их текст построчно.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(str(value) for value in data.values())
+        return str(data).encode(self.charset)
+
+
+class PlainTextRenderer(TextRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(TextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
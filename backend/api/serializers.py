@@ -1,13 +1,26 @@
-from drf_extra_fields.fields import Base64ImageField
+from collections.abc import Mapping
+
+from django.db import transaction
 from rest_framework import serializers
 
+from api.fields import (
+    BULK_OBJECTS,
+    BulkPrimaryKeyRelatedField,
+    ImageVariantField,
+    ImageVariantsField,
+    StreamingImageField,
+    resolve_in_bulk,
+)
+from api.utils import recipes_limit
 from recipes.constants import MAX_LENGTH_RECIPE_NAME
 from recipes.models import (Favorite,
                             Ingredient,
                             Recipe,
                             RecipeIngredient,
+                            ShoppingCartIngredient,
                             ShoppingList,
                             Tag)
+from users.constants import AVATAR_FORMATS, MAX_FILE_SIZE_AVATAR
 from users.models import Follow, User
 
 
@@ -15,7 +28,11 @@ class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для получения, обновления информации о пользователе"""
 
     is_subscribed = serializers.SerializerMethodField(read_only=True)
-    avatar = Base64ImageField(max_length=None, use_url=True)
+    avatar = StreamingImageField(max_length=None,
+                                 use_url=True,
+                                 max_size=MAX_FILE_SIZE_AVATAR,
+                                 formats=AVATAR_FORMATS)
+    avatar_variants = ImageVariantsField()
 
     class Meta:
         model = User
@@ -25,10 +42,14 @@ class UserSerializer(serializers.ModelSerializer):
                   'last_name',
                   'email',
                   'is_subscribed',
-                  'avatar')
+                  'avatar',
+                  'avatar_variants')
 
     def get_is_subscribed(self, obj):
         """Проверяет, подписан ли текущий юзер из сессии на блогера."""
+        # Флаг уже посчитан в запросе, см. UserQuerySet.with_is_subscribed.
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         subscribe = Follow.objects.filter(
             user=self.context['request'].user.id,
             following=obj,
@@ -62,8 +83,8 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
     Принимает пару id + amount, возвращает name + amount.
     """
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all(),
-                                            source='ingredient')
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all(),
+                                    source='ingredient')
     name = serializers.CharField(source='ingredient.name', read_only=True)
     measurement_unit = serializers.CharField(
         source='ingredient.measurement_unit', read_only=True)
@@ -86,6 +107,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientSerializer(many=True,)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -97,10 +119,14 @@ class RecipeReadSerializer(serializers.ModelSerializer):
                   'is_in_shopping_cart',
                   'name',
                   'image',
+                  'image_variants',
                   'text',
                   'cooking_time')
 
     def get_is_favorited(self, obj):
+        # Флаги уже посчитаны в запросе, см. RecipeQuerySet.with_user_flags.
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_authenticated:
             return Favorite.objects.filter(user=user,
@@ -108,6 +134,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_authenticated:
             return ShoppingList.objects.filter(user=user,
@@ -115,19 +143,46 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         return False
 
 
+class AuthorFragmentSerializer(UserSerializer):
+    """Автор рецепта без данных, зависящих от текущего юзера."""
+
+    is_subscribed = None
+
+    class Meta(UserSerializer.Meta):
+        fields = tuple(field for field in UserSerializer.Meta.fields
+                       if field != 'is_subscribed')
+
+
+class RecipeFragmentSerializer(RecipeReadSerializer):
+    """
+    Часть представления рецепта, одинаковая для всех юзеров.
+    Кэшируется в api.fragments, флаги юзера добавляются при выдаче.
+    """
+
+    author = AuthorFragmentSerializer(read_only=True)
+    is_favorited = None
+    is_in_shopping_cart = None
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = tuple(
+            field for field in RecipeReadSerializer.Meta.fields
+            if field not in ('is_favorited', 'is_in_shopping_cart')
+        )
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для записи и редактирования рецептов."""
 
     ingredients = RecipeIngredientSerializer(many=True,
                                              required=True)
-    tags = serializers.PrimaryKeyRelatedField(many=True,
-                                              queryset=Tag.objects.all(),
-                                              required=True)
+    tags = BulkPrimaryKeyRelatedField(many=True,
+                                      queryset=Tag.objects.all(),
+                                      required=True)
     name = serializers.CharField(max_length=MAX_LENGTH_RECIPE_NAME,
                                  required=True)
-    image = Base64ImageField(max_length=None,
-                             use_url=True,
-                             required=True)
+    image = StreamingImageField(max_length=None,
+                                use_url=True,
+                                required=True)
     text = serializers.CharField(required=True)
     cooking_time = serializers.IntegerField(required=True)
 
@@ -146,25 +201,41 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                             'tags',
                             'ingredients')
 
+    def to_internal_value(self, data):
+        """
+        Перед валидацией загружаем все ингредиенты и теги из запроса
+        двумя IN-запросами вместо запроса на каждый id.
+        Тело не словарь - ошибку 400 вернет проверка DRF.
+        """
+        if BULK_OBJECTS not in self.context and isinstance(data, Mapping):
+            ingredients = data.get('ingredients')
+            tags = data.get('tags')
+            resolve_in_bulk(
+                self.context,
+                Ingredient.objects.all(),
+                [item.get('id') for item in ingredients
+                 if isinstance(item, dict)]
+                if isinstance(ingredients, list) else [],
+            )
+            resolve_in_bulk(self.context,
+                            Tag.objects.all(),
+                            tags if isinstance(tags, list) else [])
+        return super().to_internal_value(data)
+
     def validate_ingredients(self, value):
         """Проверяем, что ингредиенты не пустые и уникальные."""
-        ingredients = self.initial_data.get('ingredients')
         # Проверяем, что список ингредиентов не пустой
-        if len(ingredients) == 0:
+        if len(value) == 0:
             raise serializers.ValidationError(
                 {'ingredients': "Укажите хотя бы один ингредиент."}
             )
 
-        # Список для отслеживания уникальных ингредиентов
-        ingredients_list = []
-
         # Проверяем, что ингредиенты не повторяются
-        for item in ingredients:
-            if item['id'] in ingredients_list:
-                raise serializers.ValidationError(
-                    {'ingredients': "Ингредиенты не должны повторяться."}
-                )
-            ingredients_list.append(item['id'])
+        ingredient_ids = [item['ingredient'].id for item in value]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                {'ingredients': "Ингредиенты не должны повторяться."}
+            )
 
         return value
 
@@ -194,26 +265,53 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     def complete_recipe(self,
                         recipe,
                         tags_part,
-                        ingredients_part):
+                        ingredients_part,
+                        existing_lines=None):
         """
         Функция для:
         - отдельной дозаписи тегов в Recipe;
         - отдельной дозаписи ингредиентов и их кол-ва в RecipeIngredient.
+
+        Ингредиенты записываются разницей с existing_lines (текущими
+        строками рецепта): новые - bulk_create, с другим кол-вом -
+        bulk_update, лишние - одним delete. Число запросов не зависит
+        от количества ингредиентов.
+        Возвращает изменения количеств {id ингредиента: изменение}.
         """
         # Перезаписываем существующие теги новыми
+        # (set() сам вычисляет разницу с текущими тегами).
         recipe.tags.set(tags_part)
-        # Извлечем значения из словаря:
+        existing_lines = dict(existing_lines or {})
+        to_create, to_update, deltas = [], [], {}
         for item in ingredients_part:
             ingredient = item.get('ingredient')
             amount = item.get('amount')
-            # Создадим объект связи между рецептом, ингредиентом, и кол-вом.
-            ingredient_amount, status = RecipeIngredient.objects.get_or_create(
-                recipe=recipe,
-                ingredient=ingredient,
-                amount=amount,
-            )
-        return recipe
-
+            line = existing_lines.pop(ingredient.id, None)
+            if line is None:
+                # Создадим объект связи между рецептом, ингредиентом,
+                # и кол-вом.
+                to_create.append(RecipeIngredient(recipe=recipe,
+                                                  ingredient=ingredient,
+                                                  amount=amount))
+                deltas[ingredient.id] = amount
+            elif line.amount != amount:
+                deltas[ingredient.id] = amount - line.amount
+                line.amount = amount
+                to_update.append(line)
+        # Оставшихся в existing_lines ингредиентов нет в новом списке.
+        for ingredient_id, line in existing_lines.items():
+            deltas[ingredient_id] = -line.amount
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if existing_lines:
+            RecipeIngredient.objects.filter(
+                pk__in=[line.pk for line in existing_lines.values()]
+            ).delete()
+        return deltas
+
+    @transaction.atomic
     def create(self, validated_data):
         """
         Чтобы избежать конфликтов при создании рецепта,
@@ -225,13 +323,15 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         tags_popped = validated_data.pop('tags')
         ingredients_popped = validated_data.pop('ingredients')
         # Создаем новый объект "Recipe" с оставшимися валидированными данными.
-        recipe_incomplete = Recipe.objects.create(**validated_data)
-        return self.complete_recipe(
-            recipe_incomplete,  # передаем созданный рецепт (его часть).
+        recipe = Recipe.objects.create(**validated_data)
+        self.complete_recipe(
+            recipe,  # передаем созданный рецепт (его часть).
             tags_popped,  # передаем извлеченные теги.
             ingredients_popped  # передаем извлеченные ингредиенты.
         )
+        return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """
         Обновляет существующий объект рецепта на основе валидированных данных.
@@ -257,23 +357,36 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         # Обработаем провалидированные списки отдельно.
         tags_popped = validated_data.pop('tags')
         ingredients_popped = validated_data.pop('ingredients')
-        # Очищаем теги и ингредиенты у текущего рецепта перед обновлением.
-        instance.ingredients.all().delete()
-        instance.tags.clear()
+        # Блокируем рецепт до чтения его строк: добавление рецепта
+        # в список покупок (add_recipe) дождется конца правки.
+        Recipe.objects.filter(pk=instance.pk).lock()
         # Обновляем оставшиеся поля рецепта новыми значениями.
         for key, value in validated_data.items():
             setattr(instance, key, value)
         instance.save()
-        return self.complete_recipe(
+        # Текущие ингредиенты рецепта, чтобы записать только разницу.
+        existing_lines = {
+            line.ingredient_id: line
+            for line in RecipeIngredient.objects.filter(recipe=instance)
+        }
+        deltas = self.complete_recipe(
             instance,
             tags_popped,
-            ingredients_popped
+            ingredients_popped,
+            existing_lines
         )
+        # Обновим суммы в списках покупок, где лежит рецепт.
+        ShoppingCartIngredient.objects.change_recipe(instance, deltas)
+        return instance
 
     def to_representation(self, instance):
+        # Перечитываем рецепт со всеми связями одним набором запросов,
+        # чтобы не обращаться к БД за каждым ингредиентом.
+        request = self.context.get('request')
+        instance = Recipe.objects.for_read(request.user).get(pk=instance.pk)
         return RecipeReadSerializer(
             instance,
-            context={'request': self.context.get('request')}
+            context={'request': request}
         ).data
 
 
@@ -281,8 +394,9 @@ class FavoriteShoppingListSerializer(serializers.ModelSerializer):
     """
     Сериализатор для показа атрибутов рецепта после его добавления
     в Избранное или в Список Покупок.
+    Картинка - миниатюра (оригинал, пока миниатюра не готова).
     """
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = ImageVariantField('thumbnail')
 
     class Meta:
         model = Recipe
@@ -293,8 +407,7 @@ class FollowSerializer(serializers.ModelSerializer):
     """Сериализатор модели Читатель (follower) - Блогер (following)."""
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
-    avatar = Base64ImageField(max_length=None, use_url=True)
+    avatar = serializers.ImageField(use_url=True, read_only=True)
 
     class Meta:
         model = User
@@ -317,28 +430,20 @@ class FollowSerializer(serializers.ModelSerializer):
                             'avatar')
 
     def get_is_subscribed(self, obj):
+        # Флаг и рецепты уже загружены, см. UserQuerySet.with_recipes;
+        # recipes_count - поле модели (recipes.counters).
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return Follow.objects.filter(user=request.user,
                                      following=obj).exists()
 
     def get_recipes(self, obj):
-        limit = self.context['request'].query_params.get('recipes_limit')
-        query = obj.recipes.all()
-
-        limit_value = None
-        if limit:
-            # Пробуем преобразовать limit в целое число.
-            try:
-                limit_value = int(limit)
-            except (ValueError, TypeError):
-                # Зададим limit_value в 0 при ошибках преобразования.
-                limit_value = 0
-
-        if limit_value:
-            query = query[:limit_value]
-
+        query = getattr(obj, 'prefetched_recipes', None)
+        if query is None:
+            query = obj.recipes.all()
+            limit_value = recipes_limit(self.context['request'])
+            if limit_value:
+                query = query[:limit_value]
         recipes = FavoriteShoppingListSerializer(query, many=True)
         return recipes.data
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
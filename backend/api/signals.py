@@ -0,0 +1,68 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.fragments import invalidate_recipes
+from recipes.models import Recipe, RecipeIngredient
+from users.models import User
+
+
+# Изменение рецепта меняет его updated, а с ним и ключ фрагмента
+# (api.fragments). Правки связей рецепта отмечают его измененным.
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    """Фрагмент удаленного рецепта больше не нужен."""
+    invalidate_recipes([instance])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(instance, origin=None, **kwargs):
+    """
+    Правка ингредиента рецепта (из админки или шелла). Удаления
+    queryset (API) и каскадные (рецепта) сами меняют рецепт.
+    """
+    if origin is None or origin is instance:
+        Recipe.objects.filter(pk=instance.recipe_id).touch()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    """Изменение тегов рецепта (в том числе из админки)."""
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).touch()
+    elif pk_set:
+        Recipe.objects.filter(pk__in=pk_set).touch()
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields, **kwargs):
+    """Изменение профиля автора сбрасывает фрагменты его рецептов."""
+    # Вход в систему обновляет только last_login: профиль не изменился.
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    invalidate_recipes(instance.recipes.only('id', 'updated').iterator())
+
+
+@receiver((post_save, post_delete), sender=Token)
+def token_changed(instance, **kwargs):
+    """
+    Выход (djoser logout), удаление или замена токена:
+    закэшированные токены пользователя устаревают во всех воркерах.
+    """
+    token_cache.delete(instance.key)
+    token_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(instance, created=False, **kwargs):
+    """
+    Изменение (в том числе деактивация) и удаление пользователя
+    сбрасывают его закэшированные токены во всех воркерах.
+    """
+    if not created:
+        token_cache.invalidate_user(instance.pk)
@@ -0,0 +1,597 @@
+import base64
+import io
+import tempfile
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import async_views, fragments
+from api.fields import StreamingImageField
+from api.management.commands.check_query_plans import Check
+from api.paginators import PageOrCursorPagination
+from api.serializers import RecipeReadSerializer
+from recipes.fulltext import FTS_TABLE, fts5_query
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+)
+from recipes.versioning import forget_data_versions
+from users.models import Follow, User
+
+
+@override_settings(DATA_VERSION_TTL=60)
+@mock.patch.object(PageOrCursorPagination, 'max_page_size', 100)
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    # Запросы страницы без готовых фрагментов (api.fragments) и с ними:
+    # COUNT(*) и рецепты с флагами пользователя. Версии справочников
+    # (recipes.versioning) читаются, только если поток их не помнит.
+    QUERIES = 6
+    CACHED_QUERIES = 2
+    # RecipeQuerySet.for_read без фрагментов: рецепты, авторы, теги,
+    # ингредиенты.
+    FOR_READ_QUERIES = 4
+    LIMITS = (5, 20, 100)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Рецептов', password='!')
+        authors = [
+            User.objects.create_user(
+                email=f'author-{number}@example.com',
+                username=f'author-{number}', first_name='Автор',
+                last_name='Рецептов', password='!')
+            for number in range(3)
+        ]
+        Follow.objects.create(user=cls.user, following=authors[0])
+        tags = [Tag.objects.create(name=f'Тег {number}', slug=f'tag-{number}')
+                for number in range(3)]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(10)
+        ]
+        for number in range(120):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание.', cooking_time=10,
+                author=authors[number % 3], image='recipes/images/x.png')
+            recipe.tags.set(tags[:1 + number % 3])
+            for amount in range(1, 4):
+                RecipeIngredient.objects.create(
+                    recipe=recipe,
+                    ingredient=ingredients[(number + amount) % 10],
+                    amount=amount)
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number % 3 == 0:
+                ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_page_size(self):
+        # Запросы на рецепт (автор, теги, ингредиенты, флаги) дали бы
+        # число, растущее с размером страницы.
+        for limit in self.LIMITS:
+            with self.subTest(limit=limit):
+                caches['default'].clear()
+                forget_data_versions()
+                with self.assertNumQueries(self.QUERIES):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_data_versions_read_once(self):
+        forget_data_versions()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/',
+                                       {'tags': ['tag-0', 'tag-1']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sum('recipes_dataversion' in query['sql'] for query in queries),
+            1)
+
+    def test_page_size_cached_fragments(self):
+        for limit in self.LIMITS:
+            with self.subTest(limit=limit):
+                self.client.get('/api/recipes/', {'limit': limit})
+                with self.assertNumQueries(self.CACHED_QUERIES):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_page_size_for_read(self):
+        # Без кэша фрагментов: так рецепт отдается после записи
+        # (RecipeCreateSerializer.to_representation).
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = self.user
+        for limit in self.LIMITS:
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(self.FOR_READ_QUERIES):
+                    data = RecipeReadSerializer(
+                        Recipe.objects.for_read(self.user)
+                        .order_by('-id')[:limit],
+                        many=True, context={'request': request}).data
+                self.assertEqual(len(data), limit)
+
+
+class SubscriptionsQueriesTest(TestCase):
+    """Число запросов списка подписок не зависит от размера страницы."""
+
+    # COUNT(*), авторы с флагом подписки и числом рецептов, их рецепты.
+    QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Рецептов', password='!')
+        for number in range(25):
+            author = User.objects.create_user(
+                email=f'author-{number}@example.com',
+                username=f'author-{number}', first_name='Автор',
+                last_name='Рецептов', password=None)
+            Follow.objects.create(user=cls.user, following=author)
+            for recipe_number in range(1 + number % 4):
+                Recipe.objects.create(
+                    name=f'Рецепт {recipe_number}', text='Описание.',
+                    cooking_time=10, author=author,
+                    image='recipes/images/x.png')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_page_size(self):
+        for params in ({'limit': 1}, {'limit': 6}, {'limit': 20},
+                       {'limit': 20, 'recipes_limit': 2}):
+            with self.subTest(params=params):
+                with self.assertNumQueries(self.QUERIES):
+                    response = self.client.get('/api/users/subscriptions/',
+                                               params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']),
+                                 params['limit'])
+                for author in response.data['results']:
+                    self.assertLessEqual(
+                        len(author['recipes']),
+                        params.get('recipes_limit', author['recipes_count']))
+
+
+class AsyncRecipeListTest(TestCase):
+    """Асинхронный список рецептов (api.async_views) совпадает с вьюсетом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Рецептов', password='!')
+        cls.token = Token.objects.create(user=author)
+        tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание.', cooking_time=10,
+                author=author, image='recipes/images/x.png')
+            if number % 2:
+                recipe.tags.add(tag)
+                Favorite.objects.create(user=author, recipe=recipe)
+
+    async def test_same_bytes(self):
+        for params in ({}, {'page': 2}, {'limit': 4, 'page': 3},
+                       {'limit': 100}, {'limit': 0}, {'page': 'last'},
+                       {'page': 9}, {'page': 'x'},
+                       {'tags': 'breakfast', 'limit': 2},
+                       {'is_favorited': 1}):
+            for headers in ({}, {'Authorization': f'Token {self.token}'}):
+                with self.subTest(params=params, headers=headers):
+                    expected = await sync_to_async(self.client.get)(
+                        '/api/recipes/', params, headers=headers)
+                    response = await async_views.recipe_list(
+                        AsyncRequestFactory().get('/api/recipes/', params,
+                                                  headers=headers))
+                    self.assertEqual(response.status_code,
+                                     expected.status_code)
+                    self.assertEqual(response.content, expected.content)
+
+
+class IngredientSearchLimitTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(3):
+            Ingredient.objects.create(name=f'Соль {number}',
+                                      measurement_unit='г')
+
+    def test_limit(self):
+        response = self.client.get('/api/ingredients/',
+                                   {'name': 'соль', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    @override_settings(DATA_VERSION_TTL=60)
+    def test_warm_index_without_queries(self):
+        self.client.get('/api/ingredients/', {'name': 'соль'})
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/', {'name': 'со'})
+        self.assertEqual(len(response.json()), 3)
+
+    def test_invalid_limit(self):
+        for limit in ('0', '-1', 'abc', '', '1.5'):
+            with self.subTest(limit=limit):
+                response = self.client.get('/api/ingredients/',
+                                           {'name': 'соль', 'limit': limit})
+                self.assertEqual(response.status_code, 400)
+
+
+class RecipeCreateTest(TestCase):
+
+    def test_body_not_object(self):
+        user = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Рецептов', password='!')
+        client = APIClient()
+        client.force_authenticate(user)
+        for body in ([], 'рецепт', 1):
+            with self.subTest(body=body):
+                response = client.post('/api/recipes/', body, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+class RecipeWriteQueriesTest(TestCase):
+    """Число запросов записи рецепта не зависит от числа ингредиентов."""
+
+    CREATE_QUERIES = 15
+    UPDATE_QUERIES = 19
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Рецептов', password='!')
+        cls.tags = [Tag.objects.create(name=f'Тег {number}',
+                                       slug=f'tag-{number}')
+                    for number in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(60)
+        ]
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def body(self, ingredients, amount):
+        return {
+            'ingredients': [{'id': ingredient.pk, 'amount': amount}
+                            for ingredient in ingredients],
+            'tags': [tag.pk for tag in self.tags],
+            'image': ('data:image/png;base64,'
+                      + StreamingImageFieldTest.encode('PNG')),
+            'name': 'Рецепт',
+            'text': 'Описание.',
+            'cooking_time': 10,
+        }
+
+    def test_create_and_update(self):
+        for size in (3, 30):
+            with self.subTest(size=size):
+                with self.assertNumQueries(self.CREATE_QUERIES):
+                    response = self.client.post(
+                        '/api/recipes/',
+                        self.body(self.ingredients[:size], 5), format='json')
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data['ingredients']), size)
+                # Половина строк меняет количество, половина удаляется,
+                # половина добавляется.
+                with self.assertNumQueries(self.UPDATE_QUERIES):
+                    response = self.client.patch(
+                        f'/api/recipes/{response.data["id"]}/',
+                        self.body(self.ingredients[size // 2:
+                                                   size // 2 + size], 7),
+                        format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['ingredients']), size)
+
+
+class RecipeFragmentTest(TestCase):
+
+    def setUp(self):
+        author = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Рецептов', password='!')
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание.', cooking_time=10,
+            author=author, image='recipes/images/x.png')
+
+    def test_ingredient_line_changed(self):
+        recipe = self.recipe
+        line = RecipeIngredient.objects.create(
+            recipe=recipe,
+            ingredient=Ingredient.objects.create(name='Соль',
+                                                 measurement_unit='г'),
+            amount=5)
+        url = f'/api/recipes/{recipe.pk}/'
+        self.assertEqual(
+            self.client.get(url).data['ingredients'][0]['amount'], 5)
+        # Фрагменты сбрасываются после фиксации транзакции.
+        with self.captureOnCommitCallbacks(execute=True):
+            line.amount = 7
+            line.save()
+        self.assertEqual(
+            self.client.get(url).data['ingredients'][0]['amount'], 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            line.delete()
+        self.assertEqual(self.client.get(url).data['ingredients'], [])
+
+    def test_tags_changed(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.assertEqual(self.client.get(url).data['tags'], [])
+        self.recipe.tags.add(Tag.objects.create(name='Обед', slug='lunch'))
+        self.assertEqual(
+            [tag['slug'] for tag in self.client.get(url).data['tags']],
+            ['lunch'])
+
+    def test_stale_fragment_set_after_change(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.client.get(url)
+        stale = fragments.get_cache().get_many(
+            fragments.fragment_keys([self.recipe]).values())
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        # Медленный читатель кладет фрагмент, построенный до изменения,
+        # уже после сброса кэша.
+        fragments.get_cache().set_many(stale)
+        self.assertEqual(self.client.get(url).data['name'],
+                         'Новое название')
+
+
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Рецептов', password='!')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get_me(self):
+        return self.client.get('/api/users/me/').status_code
+
+    def test_deactivated(self):
+        self.assertEqual(self.get_me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.get_me(), 401)
+
+    def test_token_deleted(self):
+        self.assertEqual(self.get_me(), 200)
+        # Как выход в другом воркере: запись о токене в кэше этого воркера
+        # остается, но версия пользователя в кэше Django уже другая.
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.filter(pk=self.token.pk).delete()
+        self.assertEqual(self.get_me(), 401)
+
+    @override_settings(DATA_VERSION_TTL=60)
+    def test_cached_without_queries(self):
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+
+
+class PrerenderedListTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    def test_accept_encoding(self):
+        for header, encoding in (('gzip, deflate', 'gzip'),
+                                 ('gzip;q=0, deflate', None),
+                                 ('deflate', None),
+                                 ('*;q=0.5', 'gzip'),
+                                 ('*, gzip;q=0', None)):
+            with self.subTest(header=header):
+                response = self.client.get('/api/tags/',
+                                           HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+
+    def test_not_modified(self):
+        response = self.client.get('/api/tags/')
+        response = self.client.get('/api/tags/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        Tag.objects.create(name='Обед', slug='lunch')
+        response = self.client.get('/api/tags/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+
+class StreamingImageFieldTest(TestCase):
+
+    @staticmethod
+    def encode(image_format):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, image_format)
+        return base64.b64encode(buffer.getvalue()).decode()
+
+    def test_formats(self):
+        for image_format in ('PNG', 'JPEG', 'GIF', 'WEBP'):
+            with self.subTest(image_format=image_format):
+                file = StreamingImageField().to_internal_value(
+                    self.encode(image_format))
+                self.assertTrue(file.name.endswith(
+                    f'.{image_format.lower().replace("jpeg", "jpg")}'))
+
+    def test_not_image(self):
+        wave = base64.b64encode(b'RIFF\x24\x00\x00\x00WAVEfmt ').decode()
+        for data in (wave, self.encode('BMP')):
+            with self.assertRaises(serializers.ValidationError):
+                StreamingImageField().to_internal_value(data)
+
+
+class RecipeTagsFilterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Рецептов', password='!')
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание.', cooking_time=10,
+            author=author, image='recipes/images/x.png')
+        cls.recipe.tags.add(
+            Tag.objects.create(name='Завтрак', slug='breakfast'))
+
+    def get(self, slug):
+        return self.client.get('/api/recipes/', {'tags': slug})
+
+    def test_tag_created_elsewhere(self):
+        self.assertEqual(self.get('breakfast').data['count'], 1)
+        # Без сигналов версия тегов не меняется, как если бы тег
+        # создали в обход моделей.
+        tag, = Tag.objects.bulk_create([Tag(name='Обед', slug='lunch')])
+        self.recipe.tags.add(tag)
+        response = self.get('lunch')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+
+    def test_unknown_tag(self):
+        self.assertEqual(self.get('dinner').status_code, 400)
+
+
+class RecipeSearchTest(TestCase):
+    """Полнотекстовый поиск ?search= (recipes.fulltext)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Рецептов', password='!')
+        # Рецепт с запросом в названии создан первым: без ранжирования
+        # (сортировка по -id) он шел бы вторым.
+        cls.named, cls.described, cls.other = (
+            Recipe.objects.create(name=name, text=text, cooking_time=10,
+                                  author=cls.author,
+                                  image='recipes/images/x.png')
+            for name, text in (
+                ('Борщ', 'Суп со свеклой.'),
+                ('Суп', 'Почти как борщ, но без свеклы.'),
+                ('Каша', 'Овсяная.'),
+            ))
+
+    def search(self, text):
+        response = self.client.get('/api/recipes/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_name_ranked_first(self):
+        self.assertEqual(self.search('борщ'),
+                         [self.named.pk, self.described.pk])
+
+    def test_recipe_edited(self):
+        self.other.name = 'Борщ зеленый'
+        self.other.save()
+        self.described.text = 'Почти как щи.'
+        self.described.save()
+        self.assertCountEqual(self.search('борщ'),
+                              [self.named.pk, self.other.pk])
+        self.assertEqual(self.search('каша'), [])
+        self.assertEqual(self.search('щи'), [self.described.pk])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Таблица FTS5 только в SQLite')
+    def test_recipe_deleted(self):
+        pk = self.named.pk
+        self.named.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {FTS_TABLE} '
+                           f'WHERE {FTS_TABLE} MATCH %s',
+                           [fts5_query('борщ')])
+            self.assertNotIn(pk, [row[0] for row in cursor.fetchall()])
+        self.assertEqual(self.search('борщ'), [self.described.pk])
+
+
+class QueryPlansTest(TestCase):
+    """Планы горячих запросов (команда check_query_plans) в CI."""
+
+    def test_query_plans(self):
+        output = io.StringIO()
+        # CommandError с плохими планами провалит тест.
+        call_command('check_query_plans', recipes=5000, users=200,
+                     stdout=output)
+        self.assertIn('Все планы в порядке.', output.getvalue())
+
+    def test_small_table_scan_is_warning(self):
+        plan = ('Hash Join\n'
+                '  ->  Seq Scan on users_user\n'
+                '  ->  Seq Scan on recipes_recipe')
+        check = Check('подписки', None, sort=True)
+        self.assertEqual(
+            check.problems(plan, 'postgresql', {'users_user'}),
+            (['полный проход по recipes_recipe'],
+             ['полный проход по маленькой таблице users_user']))
+
+
+class ShoppingCartDownloadTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='buyer@example.com', username='buyer',
+            first_name='Покупатель', last_name='Продуктов', password='!')
+        cls.token = Token.objects.create(user=cls.user)
+        recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание.', cooking_time=10,
+            author=cls.user, image='recipes/images/x.png')
+        for number in range(30):
+            RecipeIngredient.objects.create(
+                recipe=recipe,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {number}', measurement_unit='г'),
+                amount=number + 1)
+        ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    async def test_async_iterator_under_asgi(self):
+        url = '/api/recipes/download_shopping_cart/'
+        headers = {'Authorization': f'Token {self.token.key}'}
+        for file_format in ('txt', 'csv', 'json'):
+            with self.subTest(file_format=file_format):
+                response = await self.async_client.get(
+                    url, {'format': file_format}, headers=headers)
+                self.assertTrue(response.is_async)
+                content = b''.join([part async for part in response])
+                expected = await sync_to_async(self.client.get)(
+                    url, {'format': file_format},
+                    HTTP_AUTHORIZATION=f'Token {self.token.key}')
+                self.assertFalse(expected.is_async)
+                self.assertEqual(content,
+                                 b''.join(expected.streaming_content))
+                self.assertIn('Ингредиент 29'.encode(), content)
@@ -32,6 +32,20 @@ urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),  # токены
 ]
 
+if settings.ASYNC_VIEWS:
+    # Под ASGI частые GET-запросы обслуживают асинхронные вью,
+    # остальное передается тем же вьюсетам (см. api.async_views).
+    from api import async_views
+
+    urlpatterns = [
+        path('recipes/', async_views.recipe_list, name='recipes-list'),
+        path('recipes/<int:pk>/', async_views.recipe_detail,
+             name='recipes-detail'),
+        path('tags/', async_views.tag_list, name='tags-list'),
+        path('ingredients/', async_views.ingredient_list,
+             name='ingredients-list'),
+    ] + urlpatterns
+
 if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
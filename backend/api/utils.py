@@ -1,13 +1,104 @@
 # Вспомогательные утилиты приложения backend.api
+import csv
+import json
+from itertools import islice
 
-def structure_file(user_shopping_list):
-    """Создание структуры файла списка покупок."""
-    structured_list = []
-    structured_list.append('Ингридеинты для всех рецептов:\n')
+from asgiref.sync import sync_to_async
+
+from users.constants import RECIPES_LIMIT
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(user_shopping_list):
+    """Построчная генерация текстового файла списка покупок."""
+    yield 'Ингридеинты для всех рецептов:\n\n'
+    for ingredient in user_shopping_list:
+        yield (f'- {ingredient["ingredient__name"]} '
+               f'({ingredient["ingredient__measurement_unit"]}) — '
+               f'{ingredient["amount"]}\n')
+    yield '==============================\n'
+
+
+def shopping_list_csv(user_shopping_list):
+    """Построчная генерация CSV-файла списка покупок."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for ingredient in user_shopping_list:
+        yield writer.writerow((ingredient['ingredient__name'],
+                               ingredient['ingredient__measurement_unit'],
+                               ingredient['amount']))
+
+
+def shopping_list_json(user_shopping_list):
+    """Поэлементная генерация JSON-массива списка покупок."""
+    separator = '[\n'
     for ingredient in user_shopping_list:
-        structured_list.append(
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]}) — '
-            f'{ingredient["amount"]}')
-    structured_list.append('==============================\n')
-    return '\n'.join(structured_list)
+        yield separator + json.dumps(
+            {'name': ingredient['ingredient__name'],
+             'measurement_unit': ingredient['ingredient__measurement_unit'],
+             'amount': ingredient['amount']},
+            ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+async def aiterate(parts, chunk_size):
+    """
+    Асинхронный обход синхронного генератора для StreamingHttpResponse
+    под ASGI: синхронный итератор Django 4.2 читает в память целиком.
+    Части берутся порциями по chunk_size в потоке запроса, где открыт
+    курсор базы данных.
+    """
+    next_chunk = sync_to_async(lambda: ''.join(islice(parts, chunk_size)),
+                               thread_sensitive=True)
+    while True:
+        chunk = await next_chunk()
+        if not chunk:
+            return
+        yield chunk
+
+
+# Формат файла (?format=) -> генератор и тип содержимого файла.
+SHOPPING_LIST_FORMATS = {
+    'txt': (shopping_list_txt, 'text/plain; charset=utf-8'),
+    'csv': (shopping_list_csv, 'text/csv; charset=utf-8'),
+    'json': (shopping_list_json, 'application/json; charset=utf-8'),
+}
+
+
+def recipes_limit(request):
+    """
+    Значение ?recipes_limit= или None.
+    Нечисловое и неположительное значение - без ограничения.
+    """
+    try:
+        limit = int(request.query_params.get(RECIPES_LIMIT))
+    except (ValueError, TypeError):
+        return None
+    return limit if limit > 0 else None
+
+
+def search_limit(value):
+    """
+    Значение ?limit= поиска ингредиентов: None без параметра,
+    иначе положительное целое. Другое значение - ValueError.
+    """
+    if value is None:
+        return None
+    if not (value.isascii() and value.isdigit()) or int(value) <= 0:
+        raise ValueError(value)
+    return int(value)
+
+
+def percentile(values, percent):
+    """Перцентиль percent выборки values (для нагрузочных тестов)."""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)]
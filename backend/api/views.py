@@ -1,16 +1,32 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import hashlib
+from functools import lru_cache
+from itertools import chain
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import (
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticated,
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from api.filters import NameSearchFilter, ExtraParamsFilter
-from api.paginators import PageOrLimitPagination
+from api.filters import ExtraParamsFilter, RecipeOrderingFilter
+from api.fragments import render_recipes
+from api.importers import RecipeImporter
+from api.mixins import PrerenderedListMixin
+from api.paginators import PageOrCursorPagination
 from api.permissions import IsAuthorOrReadOnly, IsOwnerOrReadOnly
+from api.renderers import CSVRenderer, PlainTextRenderer
 from api.serializers import (
     UserSerializer,
     FavoriteShoppingListSerializer,
@@ -20,17 +36,39 @@ from api.serializers import (
     RecipeReadSerializer,
     TagSerializer
 )
-from api.utils import structure_file
+from api.utils import (
+    SHOPPING_LIST_FORMATS,
+    aiterate,
+    recipes_limit,
+    search_limit,
+)
+from recipes.constants import (
+    FACETS,
+    LEGACY_SHORT_LINKS_CACHE_SIZE,
+    LIMIT,
+    NAME,
+    SHOPPING_LIST_CHUNK_SIZE,
+    SHOPPING_LIST_FILENAME,
+)
+from recipes.facets import count_facets
+from recipes.feed import feed_recipes
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
+    ShoppingCartIngredient,
     ShoppingList,
     Tag
 )
+from recipes.search import ingredient_index
+from recipes.short_links import decode_code
+from recipes.tags import tag_cache
+from recipes.versioning import INGREDIENTS, TAGS, get_data_version
 from users.models import User, Follow
 
+# Ключ кэша фасетов: версия тегов и хэш параметров фильтров.
+FACETS_KEY = 'recipe-facets:{tags}:{filters}'
+
 
 class UserViewSet(viewsets.GenericViewSet):
     """
@@ -46,7 +84,7 @@ class UserViewSet(viewsets.GenericViewSet):
 
     queryset = User.objects.all()
     permission_classes = (IsOwnerOrReadOnly,)
-    pagination_class = PageOrLimitPagination
+    pagination_class = PageOrCursorPagination
     filter_backends = (DjangoFilterBackend,
                        filters.OrderingFilter)
     ordering = ('-id',)
@@ -82,6 +120,12 @@ class UserViewSet(viewsets.GenericViewSet):
         return Response({'detail': 'Аватарка удалена.'},
                         status=status.HTTP_204_NO_CONTENT)
 
+    def subscribed_authors(self, request):
+        """Авторы с данными для FollowSerializer без запросов на автора."""
+        return (User.objects
+                .with_is_subscribed(request.user)
+                .with_recipes(recipes_limit(request)))
+
     @action(detail=False,
             methods=['get'],
             serializer_class=FollowSerializer,
@@ -90,7 +134,8 @@ class UserViewSet(viewsets.GenericViewSet):
         """Список всех подписок пользователя."""
         user = request.user
         # Находим пользователей, на которых подписан текущий пользователь.
-        following = User.objects.filter(following__user=user)
+        following = self.subscribed_authors(request).filter(
+            following__user=user).order_by(*self.ordering)
         pages = self.paginate_queryset(following)
         # Если результаты пагинации существуют, сериализуем их.
         if pages is not None:
@@ -121,8 +166,9 @@ class UserViewSet(viewsets.GenericViewSet):
                                 status=status.HTTP_400_BAD_REQUEST)
 
             Follow.objects.create(user=reader, following=blogger)
-            serializer = FollowSerializer(blogger,
-                                          context={'request': request})
+            serializer = FollowSerializer(
+                self.subscribed_authors(request).get(pk=blogger.pk),
+                context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         # Обработка метода DELETE
@@ -138,24 +184,41 @@ class UserViewSet(viewsets.GenericViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(PrerenderedListMixin, ReadOnlyModelViewSet):
     """Вьюсет для получения информации о тегах списком или по id."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    data_version = TAGS
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(PrerenderedListMixin, ReadOnlyModelViewSet):
     """Вьюсет для получения информации о ингредиентах списком или по id."""
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (NameSearchFilter,)
-    search_fields = ('^name',)
     pagination_class = None
+    data_version = INGREDIENTS
+
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск ингредиентов по началу названия: ?name=<префикс>.
+        Ответ строится по индексу в памяти воркера, без запросов к БД.
+        Необязательный ?limit= ограничивает число результатов.
+        Без ?name= отдается весь справочник (см. PrerenderedListMixin).
+        """
+        name = request.query_params.get(NAME)
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = search_limit(request.query_params.get(LIMIT))
+        except ValueError:
+            return Response({LIMIT: 'Укажите целое положительное число.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(ingredient_index.search(name, limit))
 
 
 class RecipeViewSet(ModelViewSet):
@@ -165,15 +228,105 @@ class RecipeViewSet(ModelViewSet):
     permission_classes = (IsAuthorOrReadOnly,)
     filterset_class = ExtraParamsFilter
     filter_backends = (DjangoFilterBackend,
-                       filters.OrderingFilter)
-    pagination_class = PageOrLimitPagination
+                       RecipeOrderingFilter)
+    pagination_class = PageOrCursorPagination
     ordering = ('-id',)
+    # Популярные рецепты: ?ordering=-favorites_count,-id (есть индекс),
+    # рецепты в тренде: ?ordering=trending.
+    ordering_fields = ('id', 'name', 'cooking_time', 'author',
+                       'favorites_count', 'in_carts_count')
+
+    def get_queryset(self):
+        # Для чтения достаточно рецептов с флагами пользователя:
+        # остальное представление рецепта берется из кэша фрагментов.
+        if self.action in ('list', 'retrieve', 'feed'):
+            user = self.request.user
+            queryset = (Recipe.objects
+                        .with_user_flags(user)
+                        .with_author_subscription(user))
+            if self.action == 'feed':
+                queryset = feed_recipes(user, queryset)
+            return queryset
+        return Recipe.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(
+                render_recipes(page, request))
+            if request.query_params.get(FACETS, '').lower() in ('1', 'true'):
+                response.data[FACETS] = self.get_facets()
+            return response
+        return Response(render_recipes(list(queryset), request))
+
+    def get_facets(self):
+        """
+        Фасеты для фильтров запроса (recipes.facets).
+        Анонимам одинаковые фасеты отдаются из кэша
+        на RECIPE_FACETS_TIMEOUT секунд.
+        """
+        request = self.request
+        params = request.query_params.copy()
+        slugs = params.pop('tags', [])
+        ids = tag_cache.ids()
+        tag_ids = [ids[slug] for slug in slugs if slug in ids]
+        key = None
+        if not request.user.is_authenticated:
+            filters = urlencode(sorted(
+                (name, value)
+                for name in ExtraParamsFilter.base_filters
+                for value in request.query_params.getlist(name)))
+            key = FACETS_KEY.format(
+                tags=get_data_version(TAGS),
+                filters=hashlib.sha1(filters.encode()).hexdigest())
+            facets = cache.get(key)
+            if facets is not None:
+                return facets
+        queryset = Recipe.objects.all()
+        if self.action == 'feed':
+            queryset = feed_recipes(request.user, queryset)
+        queryset = ExtraParamsFilter(params, queryset, request=request).qs
+        facets = count_facets(queryset, tag_ids)
+        if key is not None:
+            cache.set(key, facets, settings.RECIPE_FACETS_TIMEOUT)
+        return facets
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(render_recipes([self.get_object()], request)[0])
 
     def get_serializer_class(self):
-        if self.action == 'list' or self.action == 'retrieve':
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request, *args, **kwargs):
+        """
+        Лента подписок: рецепты авторов, на которых подписан
+        пользователь (recipes.feed). Фильтры и пагинация как у списка.
+        """
+        return self.list(request, *args, **kwargs)
+
+    @action(detail=False,
+            methods=['post'],
+            url_path='import',
+            permission_classes=[IsAdminUser])
+    def import_recipes(self, request, *args, **kwargs):
+        """
+        Массовый импорт рецептов от имени текущего пользователя.
+        Принимает список рецептов в формате POST /recipes/.
+        Ошибки отдельных рецептов возвращаются с их номерами в списке
+        и не мешают импорту остальных.
+        """
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Ожидается список рецептов.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        report = RecipeImporter(request.user).run(enumerate(request.data))
+        return Response(report, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['get'], url_path='get-link',)
     def get_link(self, request, *args, **kwargs):
         """Получить короткую ссылку на рецепт."""
@@ -223,34 +376,37 @@ class RecipeViewSet(ModelViewSet):
 
     @action(detail=False,
             methods=['get'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=[PlainTextRenderer,
+                              CSVRenderer,
+                              JSONRenderer])
     def download_shopping_cart(self, request, *args, **kwargs):
         """
         Генерация списка покупок из всех рецептов, добавленных в список.
         Повторяющиеся ингридиенты складываются по их количеству.
+        Формат файла выбирается параметром ?format=txt|csv|json
+        (по умолчанию txt), файл отдается потоком.
         """
-        # Фильтруем объекты модели RecipeIngredient,
-        # выбирая только те, у которых рецепт находится в корзине
-        # покупок (related_name='shoppinglist') пользователя request.user.
-        # Выполним JOIN используя внешние ключи, начиная с поля recipe.
-        # После фильтрации выбираем только необходимые поля:
-        # 'ingredient__name' — название ингредиента
-        # 'ingredient__measurement_unit' — единица измерения ингредиента.
-        shopping_list = (RecipeIngredient.objects
-                         .filter(recipe__shoppinglist__user=request.user.id)
-                         .values('ingredient__name',
-                                 'ingredient__measurement_unit')
-                         .annotate(amount=Sum('amount')))
-        print(shopping_list)
-        # Проверка, пуст ли список покупок.
-        if not shopping_list.exists():
+        # Суммы ингредиентов по всем рецептам из списка покупок
+        # заранее посчитаны в ShoppingCartIngredient (см. его менеджер):
+        # читаем готовые строки юзера по индексу (user, ingredient).
+        shopping_list = (ShoppingCartIngredient.objects
+                         .lines(request.user)
+                         # Серверный курсор: строки читаются порциями.
+                         .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE))
+        # Единственный запрос: проверяем пустоту по первой строке.
+        first_line = next(shopping_list, None)
+        if first_line is None:
             return Response({'detail': 'Ваш список покупок пуст.'},
                             status=status.HTTP_400_BAD_REQUEST)
-        # Если не пуст, сфоримируем файл.
-        download_list = structure_file(shopping_list)
-        response = HttpResponse(download_list,
-                                content_type='text/plain; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="qweqwe.txt"'
+        file_format = request.accepted_renderer.format
+        generate_file, content_type = SHOPPING_LIST_FORMATS[file_format]
+        content = generate_file(chain((first_line,), shopping_list))
+        if isinstance(request._request, ASGIRequest):
+            content = aiterate(content, SHOPPING_LIST_CHUNK_SIZE)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{SHOPPING_LIST_FILENAME}.{file_format}"')
         return response
 
     @action(detail=True,
@@ -264,7 +420,21 @@ class RecipeViewSet(ModelViewSet):
                                      pk)
 
 
+@lru_cache(maxsize=LEGACY_SHORT_LINKS_CACHE_SIZE)
+def legacy_recipe_id(short_url_code):
+    """id рецепта по короткому коду старого формата."""
+    return (Recipe.objects.filter(legacy_short_url_code=short_url_code)
+            .values_list('id', flat=True).first())
+
+
 def redirect_to_full(request, short_url_code):
-    """Перенаправление с короткой ссылки на исходный рецепт."""
-    recipe = get_object_or_404(Recipe, short_url_code=short_url_code)
-    return redirect(f'/recipes/{recipe.id}')
+    """
+    Перенаправление с короткой ссылки на исходный рецепт.
+    id вычисляется из кода без запроса к базе данных;
+    старые коды ищутся в базе через LRU-кэш процесса.
+    """
+    recipe_id = (decode_code(short_url_code)
+                 or legacy_recipe_id(short_url_code))
+    if recipe_id is None:
+        raise Http404
+    return redirect(f'/recipes/{recipe_id}')
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+# Под ASGI самые частые GET-запросы обслуживают асинхронные вью.
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
@@ -25,6 +25,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', default='default_key')
 
+# Ключ перестановки id рецептов в коды коротких ссылок.
+# Смена ключа меняет все выданные короткие ссылки.
+SHORT_LINK_SECRET = os.getenv('SHORT_LINK_SECRET', default=SECRET_KEY)
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DJANGO_DEBUG', 'False') == 'True'
 
@@ -40,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'django_filters',
     'rest_framework.authtoken',
@@ -96,6 +101,29 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# По умолчанию - кэш в памяти процесса. Для нескольких воркеров лучше
+# общий кэш (например, Memcached/Redis или файловый), чтобы кэш рецептов
+# был одинаков во всех воркерах. Версии справочников хранятся в базе
+# (recipes.versioning) и от кэша не зависят.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'DJANGO_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
+# Кэш представлений рецептов без данных пользователя (api.fragments).
+RECIPE_FRAGMENT_CACHE = os.getenv('RECIPE_FRAGMENT_CACHE', 'default')
+RECIPE_FRAGMENT_TIMEOUT = int(os.getenv('RECIPE_FRAGMENT_TIMEOUT', 3600))
+# Время жизни фасетов списка рецептов для анонимов (api.views), секунды.
+RECIPE_FACETS_TIMEOUT = int(os.getenv('RECIPE_FACETS_TIMEOUT', 30))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -152,13 +180,46 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+
+    # Картинки можно загружать multipart-запросом, см. api.parsers.
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'api.parsers.MultiPartJSONParser',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
 
+# Асинхронные вью чтения (api.async_views); включаются в foodgram/asgi.py.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+# Потоки построения вариантов картинок (recipes.images);
+# 0 - строить сразу после сохранения, в том же потоке.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Потоки раскладки новых рецептов по лентам подписчиков (recipes.feed);
+# 0 - раскладывать сразу после фиксации транзакции, в том же потоке.
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', 1))
+
+# Сколько секунд поток помнит версии справочных данных
+# (recipes.versioning), прежде чем перечитать их из базы.
+DATA_VERSION_TTL = float(os.getenv('DATA_VERSION_TTL', 2))
+
+# Кэш токенов для api.authentication.CachedTokenAuthentication.
+# Версии пользователей хранятся в кэше Django: с общим кэшем выход и
+# деактивация действуют во всех воркерах сразу, иначе - не позже чем
+# через TIMEOUT секунд.
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': int(os.getenv('TOKEN_AUTH_CACHE_SIZE', 10000)),
+    'TIMEOUT': int(os.getenv('TOKEN_AUTH_CACHE_TIMEOUT', 60)),
+    'USE_DJANGO_CACHE': os.getenv('TOKEN_AUTH_USE_DJANGO_CACHE',
+                                  'False') == 'True',
+}
+
 DJOSER = {
     'SERIALIZERS': {
         'user': 'api.serializers.UserSerializer',
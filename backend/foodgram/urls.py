@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
-from api.views import redirect_to_full
+if settings.ASYNC_VIEWS:
+    from api.async_views import redirect_to_full
+else:
+    from api.views import redirect_to_full
 
 
 # /s/{short_url_code} -- доступ по короткой ссылке.
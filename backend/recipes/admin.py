@@ -3,14 +3,17 @@ from django.contrib import admin
 from django.core.exceptions import ValidationError
 
 
+from recipes.counters import change_counter
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
+    ShoppingCartIngredient,
     ShoppingList,
     Tag
 )
+from users.models import User
 
 
 class IngredientInlineFormSet(BaseInlineFormSet):
@@ -81,9 +84,17 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name', 'author__username')
     list_filter = ('tags',)
 
-    @admin.display(description='Добавлений в избранное:')
+    @admin.display(description='Добавлений в избранное:',
+                   ordering='favorites_count')
     def count_favorites(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'author' in form.changed_data:
+            # Рецепт передан другому автору: перенесем его в счетчиках.
+            change_counter(User, form.initial['author'], 'recipes_count', -1)
+            change_counter(User, obj.author_id, 'recipes_count', 1)
 
 
 @admin.register(RecipeIngredient)
@@ -93,6 +104,12 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
     search_fields = ('recipe__name', 'ingredient__username')
 
+    def delete_queryset(self, request, queryset):
+        # По одной строке: их удаление вычитается из списков покупок
+        # (recipes.signals).
+        for line in queryset:
+            line.delete()
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -104,3 +121,10 @@ class FavoriteAdmin(admin.ModelAdmin):
 class ShoppingListAdmin(admin.ModelAdmin):
     """Класс настройки модели ShoppingList в админке."""
     list_display = ('pk', 'user', 'recipe')
+
+
+@admin.register(ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(admin.ModelAdmin):
+    """Класс настройки модели ShoppingCartIngredient в админке."""
+    list_display = ('pk', 'user', 'ingredient', 'amount')
+    search_fields = ('user__username',)
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def install_fulltext(using, **kwargs):
+    """Поисковый индекс рецептов после миграций (recipes.fulltext)."""
+    from recipes.fulltext import install
+    install(connections[using])
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        # Подключаем обработчики сигналов моделей.
+        import recipes.signals  # noqa: F401
+        post_migrate.connect(install_fulltext, sender=self)
@@ -5,9 +5,62 @@ REGEXP_SLUG = r'^[-a-zA-Z0-9_]+$'
 MAX_LENGTH_INGRIDIENT_NAME = 128
 MAX_LENGTH_MEASURMENT_UNIT = 64
 MAX_LENGTH_RECIPE_NAME = 256
+MAX_LENGTH_DATA_VERSION_NAME = 64
 MIN_COOKING_TIME_MINUTES = 1
 MIN_AMOUNT_OF_INGREDIENT = 1
+# Параметр поиска ингредиента по началу названия.
+NAME = 'name'
+# Фасеты списка рецептов (recipes.facets): ?facets=true. Верхние
+# границы интервалов времени приготовления в минутах, последний
+# интервал - больше 60 минут.
+FACETS = 'facets'
+COOKING_TIME_FACETS = (15, 30, 60)
+# Параметр полнотекстового поиска рецептов (recipes.fulltext).
+SEARCH = 'search'
+# Нечеткий поиск по триграммам подключается, если точных совпадений
+# меньше FUZZY_SEARCH_MIN_RESULTS. Порог похожести как в pg_trgm.
+FUZZY_SEARCH_MIN_RESULTS = 10
+TRIGRAM_THRESHOLD = 0.3
+# Выгрузка списка покупок.
+SHOPPING_LIST_FILENAME = 'shopping_list'
+SHOPPING_LIST_CHUNK_SIZE = 500
+# Массовый импорт рецептов: размер пачки (одна транзакция).
+RECIPE_IMPORT_CHUNK_SIZE = 100
 # Для кастомной пагинации:
 MAX_PAGE_SIZE = 20
 PAGE_SIZE = 5
 LIMIT = 'limit'
+# Пагинация по курсору включается параметром ?pagination=cursor.
+PAGINATION = 'pagination'
+CURSOR = 'cursor'
+# Короткие ссылки: длина кода для id < 2**32 и размер LRU старых кодов.
+SHORT_LINK_LENGTH = 6
+LEGACY_SHORT_LINKS_CACHE_SIZE = 4096
+# Варианты картинки рецепта (recipes.images):
+# {вариант: ((ширина, высота), обрезать до размера, формат)}.
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': ((320, 320), True, 'JPEG'),
+    'webp': ((1280, 1280), False, 'WEBP'),
+}
+IMAGE_VARIANT_QUALITY = 80
+# Загрузка картинок рецептов (api.fields.StreamingImageField).
+MAX_RECIPE_IMAGE_SIZE = 10
+RECIPE_IMAGE_FORMATS = ('PNG', 'JPEG', 'GIF', 'WEBP')
+# Предел размера картинки в пикселях (ширина * высота).
+MAX_IMAGE_PIXELS = 40_000_000
+# Рейтинг «в тренде» (recipes.trending): события за TRENDING_WINDOW_DAYS,
+# вес события уменьшается вдвое каждые TRENDING_HALF_LIFE_HOURS.
+TRENDING = 'trending'
+TRENDING_WINDOW_DAYS = 7
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_FAVORITE_WEIGHT = 1.0
+TRENDING_CART_WEIGHT = 0.5
+TRENDING_NEW_RECIPE_WEIGHT = 2.0
+# Лента подписок (recipes.feed): рецепты автора раскладываются по лентам
+# подписчиков, если подписчиков не больше FEED_FANOUT_MAX_FOLLOWERS,
+# иначе подмешиваются при чтении. Длина ленты - до FEED_MAX_LENGTH.
+FEED_FANOUT_MAX_FOLLOWERS = 5000
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_MAX_LENGTH = 500
+# Сколько последних рецептов автора добавить в ленту при подписке.
+FEED_BACKFILL_SIZE = 20
@@ -0,0 +1,67 @@
+# Счетчики популярности в строках рецептов и пользователей.
+#
+# favorites_count и in_carts_count рецепта, recipes_count и
+# followers_count пользователя меняются атомарно выражениями F()
+# в сигналах (recipes.signals) и при импорте рецептов, без чтения строки
+# и без COUNT по связанной таблице. Расхождения (например, после
+# ручных правок в БД или смены рецепта у строки избранного в админке)
+# исправляет manage.py reconcile_counters.
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingList
+from users.models import Follow, User
+
+# (модель со счетчиком, поле счетчика, модель строк, поле связи строки).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Прибавляет delta к счетчику одним UPDATE.
+    Счетчик, разошедшийся с данными, не уходит ниже нуля.
+    """
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, Value(0))})
+
+
+def count_row(row, delta):
+    """Учитывает в счетчиках добавление (+1) или удаление (-1) строки."""
+    for model, field, rows, link in COUNTERS:
+        if isinstance(row, rows):
+            change_counter(model, getattr(row, f'{link}_id'), field, delta)
+
+
+def actual_count(rows, link):
+    """Подзапрос: число строк модели rows, ссылающихся на объект."""
+    return Coalesce(
+        Subquery(rows.objects
+                 .filter(**{link: OuterRef('pk')})
+                 .order_by()
+                 .values(link)
+                 .annotate(total=Count('pk'))
+                 .values('total')),
+        Value(0),
+    )
+
+
+def drifted(model, field, rows, link):
+    """Объекты, у которых счетчик не совпадает с числом строк."""
+    return (model.objects
+            .annotate(actual=actual_count(rows, link))
+            .exclude(**{field: F('actual')}))
+
+
+def reconcile(model, field, rows, link):
+    """Пересчитывает разошедшиеся счетчики, возвращает их число."""
+    pks = list(drifted(model, field, rows, link)
+               .values_list('pk', flat=True))
+    if pks:
+        model.objects.filter(pk__in=pks).update(
+            **{field: actual_count(rows, link)})
+    return len(pks)
@@ -0,0 +1,152 @@
+# Лента подписок: рецепты авторов, на которых подписан пользователь.
+#
+# Для обычных авторов лента строится при записи (fan-out on write):
+# новый рецепт после фиксации транзакции раскладывается пачками
+# в TimelineEntry всех подписчиков автора, и чтение ленты - выборка
+# по индексу (user, recipe) без соединения с Follow и рецептами всех
+# авторов. У авторов с числом подписчиков больше FEED_FANOUT_MAX_FOLLOWERS
+# раскладка слишком дорога: их рецепты подмешиваются при чтении
+# (fan-out on read). Порог сравнивается с User.followers_count
+# (recipes.counters), поэтому автор, опустившийся ниже порога,
+# раскладывается только для новых рецептов.
+# Раскладка идет в пуле потоков (settings.FEED_WORKERS), чтобы не
+# задерживать ответ автору. В ленте хранятся до FEED_MAX_LENGTH последних
+# рецептов, лишнее удаляет manage.py trim_feeds.
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Q
+
+from recipes.constants import (
+    FEED_BACKFILL_SIZE,
+    FEED_FANOUT_BATCH_SIZE,
+    FEED_FANOUT_MAX_FOLLOWERS,
+    FEED_MAX_LENGTH,
+)
+from recipes.models import Recipe, TimelineEntry
+from users.models import Follow, User
+
+logger = logging.getLogger(__name__)
+
+executor = (ThreadPoolExecutor(max_workers=settings.FEED_WORKERS,
+                               thread_name_prefix='feed-fan-out')
+            if settings.FEED_WORKERS else None)
+
+
+def fans_out(author_id):
+    """Раскладываются ли рецепты автора по лентам при записи."""
+    followers = (User.objects.filter(pk=author_id)
+                 .values_list('followers_count', flat=True).first())
+    return followers is not None and followers <= FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out(author_id, recipe_ids):
+    """
+    Добавляет рецепты автора в ленты его подписчиков пачками по
+    FEED_FANOUT_BATCH_SIZE записей. Возвращает число записей.
+    """
+    if not recipe_ids or not fans_out(author_id):
+        return 0
+    followers = (Follow.objects.filter(following_id=author_id)
+                 .values_list('user_id', flat=True)
+                 .iterator(chunk_size=FEED_FANOUT_BATCH_SIZE))
+    batch = []
+    created = 0
+    for user_id in followers:
+        batch.extend(TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+                     for recipe_id in recipe_ids)
+        if len(batch) >= FEED_FANOUT_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+    return created + len(batch)
+
+
+def fan_out_in_pool(author_id, recipe_ids):
+    try:
+        fan_out(author_id, recipe_ids)
+    except DatabaseError:
+        logger.exception('Не удалось разложить рецепты %s по лентам',
+                         recipe_ids)
+    finally:
+        # Соединение потока пула с БД не переживает задачу.
+        connection.close()
+
+
+def run(author_id, recipe_ids):
+    if executor is None:
+        fan_out(author_id, recipe_ids)
+    else:
+        executor.submit(fan_out_in_pool, author_id, recipe_ids)
+
+
+def schedule_fan_out(author_id, recipe_ids):
+    """Раскладка рецептов по лентам после фиксации транзакции."""
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: run(author_id, recipe_ids))
+
+
+def follow(user_id, author_id):
+    """Новая подписка: последние рецепты автора попадают в ленту."""
+    if not fans_out(author_id):
+        return
+    recipe_ids = (Recipe.objects.filter(author_id=author_id)
+                  .order_by('-id')
+                  .values_list('id', flat=True)[:FEED_BACKFILL_SIZE])
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+         for recipe_id in recipe_ids),
+        ignore_conflicts=True,
+    )
+
+
+def unfollow(user_id, author_id):
+    """Отписка: рецепты автора уходят из ленты."""
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 recipe__author_id=author_id).delete()
+
+
+def feed_recipes(user, queryset):
+    """Рецепты ленты пользователя из queryset рецептов (fan-out on write)."""
+    celebrities = list(Follow.objects
+                       .filter(user=user,
+                               following__followers_count__gt=(
+                                   FEED_FANOUT_MAX_FOLLOWERS))
+                       .values_list('following_id', flat=True))
+    if not celebrities:
+        # Соединение с лентой: план идет от индекса (user, recipe).
+        return queryset.filter(timeline_entries__user=user)
+    return queryset.filter(
+        Q(pk__in=TimelineEntry.objects.filter(user=user).values('recipe'))
+        | Q(author__in=celebrities))
+
+
+def joined_feed_recipes(user, queryset):
+    """
+    Та же лента без TimelineEntry (fan-out on read): соединение
+    рецептов с подписками при каждом чтении. Для сравнения
+    в manage.py benchmark_feed.
+    """
+    return queryset.filter(author__in=Follow.objects.filter(user=user)
+                           .values('following'))
+
+
+def trim_feeds(max_length=FEED_MAX_LENGTH):
+    """Удаляет из лент записи старше max_length последних рецептов."""
+    users = (TimelineEntry.objects
+             .order_by()
+             .values('user')
+             .annotate(entries=Count('pk'))
+             .filter(entries__gt=max_length)
+             .values_list('user', flat=True))
+    deleted = 0
+    for user_id in users.iterator():
+        cutoff = (TimelineEntry.objects.filter(user_id=user_id)
+                  .order_by('-recipe_id')
+                  .values_list('recipe_id', flat=True)[max_length - 1])
+        deleted += TimelineEntry.objects.filter(
+            user_id=user_id, recipe_id__lt=cutoff).delete()[0]
+    return deleted
@@ -0,0 +1,156 @@
+# Полнотекстовый поиск рецептов по названию и описанию (?search=).
+#
+# Поисковый индекс живет в БД и обновляется ее триггерами, поэтому
+# его не минуют bulk_create импорта, админка и правки в БД:
+# - PostgreSQL: колонка search_vector (tsvector) с GIN-индексом.
+#   Вектор строится по русской и английской конфигурациям,
+#   название весит больше описания (веса A и B). Ранжирование - ts_rank;
+# - SQLite: таблица FTS5 recipes_recipe_fts с внешним содержимым
+#   (content='recipes_recipe'). Стемминга нет, поэтому слова запроса
+#   ищутся по префиксу. Ранжирование - bm25, название весит в 10 раз
+#   больше описания;
+# - прочие СУБД: icontains без ранжирования.
+# В модели Recipe поля нет: обычные запросы рецептов не читают вектор.
+# Объекты создает install() из миграции и после каждой миграции:
+# при перестройке таблицы рецептов SQLite теряет ее триггеры.
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса названия и описания в bm25 (SQLite).
+NAME_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+
+POSTGRESQL_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(NEW.text, '')), 'B')"
+)
+POSTGRESQL_INSTALL = (
+    'ALTER TABLE recipes_recipe '
+    'ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    'CREATE OR REPLACE FUNCTION recipes_recipe_search_vector() '
+    'RETURNS trigger AS $$ BEGIN '
+    f'NEW.search_vector := {POSTGRESQL_VECTOR}; '
+    'RETURN NEW; END $$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector '
+    'ON recipes_recipe',
+    'CREATE TRIGGER recipes_recipe_search_vector '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector()',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+POSTGRESQL_FILL = ('UPDATE recipes_recipe SET name = name '
+                   'WHERE search_vector IS NULL')
+POSTGRESQL_UNINSTALL = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector()',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_insert': (
+        'AFTER INSERT ON recipes_recipe BEGIN '
+        f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+        'VALUES (new.id, new.name, new.text); END'
+    ),
+    f'{FTS_TABLE}_delete': (
+        'AFTER DELETE ON recipes_recipe BEGIN '
+        f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+        "VALUES ('delete', old.id, old.name, old.text); END"
+    ),
+    f'{FTS_TABLE}_update': (
+        'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+        f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+        "VALUES ('delete', old.id, old.name, old.text); "
+        f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+        'VALUES (new.id, new.name, new.text); END'
+    ),
+}
+
+
+def install(connection):
+    """Создает поисковый индекс и триггеры, если их еще нет."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for statement in POSTGRESQL_INSTALL:
+                cursor.execute(statement)
+            cursor.execute(POSTGRESQL_FILL)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                "name, text, content='recipes_recipe', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')")
+            cursor.execute("SELECT name FROM sqlite_master "
+                           "WHERE type = 'trigger' AND tbl_name = "
+                           "'recipes_recipe'")
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = SQLITE_TRIGGERS.keys() - existing
+            for name in missing:
+                cursor.execute(
+                    f'CREATE TRIGGER {name} {SQLITE_TRIGGERS[name]}')
+            if missing:
+                # Пока триггеров не было, индекс мог отстать от таблицы.
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) "
+                               "VALUES ('rebuild')")
+
+
+def uninstall(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for statement in POSTGRESQL_UNINSTALL:
+                cursor.execute(statement)
+        elif connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def fts5_query(text):
+    """
+    Запрос FTS5 из текста пользователя: все слова по префиксу.
+    Слова берутся в кавычки, так что синтаксис FTS5 в тексте не работает.
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+
+def search_recipes(queryset, text):
+    """
+    Рецепты queryset, подходящие под запрос text, с релевантностью
+    search_rank (больше - лучше).
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = ("(websearch_to_tsquery('russian', %s) || "
+                   "websearch_to_tsquery('english', %s))")
+        return (queryset
+                .filter(RawSQL(f'recipes_recipe.search_vector @@ {tsquery}',
+                               (text, text), output_field=BooleanField()))
+                .annotate(search_rank=RawSQL(
+                    f'ts_rank(recipes_recipe.search_vector, {tsquery})',
+                    (text, text), output_field=FloatField())))
+    if vendor == 'sqlite':
+        match = fts5_query(text)
+        if not match:
+            return queryset.annotate(search_rank=Value(
+                0.0, output_field=FloatField())).none()
+        # Соединение с таблицей FTS5 через extra(): bm25() считается только
+        # в запросе с MATCH к самой таблице. Коррелированный подзапрос
+        # повторял бы MATCH для каждой найденной строки.
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = recipes_recipe.id',
+                   f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'-bm25({FTS_TABLE}, {NAME_WEIGHT}, '
+                                   f'{TEXT_WEIGHT})'},
+        )
+    return (queryset
+            .filter(Q(name__icontains=text) | Q(text__icontains=text))
+            .annotate(search_rank=Value(0.0, output_field=FloatField())))
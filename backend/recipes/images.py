@@ -0,0 +1,151 @@
+# Фоновая обработка картинок рецептов и аватаров.
+#
+# Запрос только сохраняет загруженный файл. После фиксации транзакции
+# пул потоков строит варианты картинки: миниатюру фиксированного размера
+# и WebP. Пути вариантов хранятся в поле image_variants модели вместе с
+# путем исходной картинки (source). Пока варианты не построены или
+# построены для прежней картинки, клиенты получают оригинал
+# (см. variant_url). Сохранение image_variants идет через save(), так что
+# сигналы сбрасывают кэши представлений (api.signals), а у рецепта
+# меняется updated (ключ его фрагмента, api.fragments).
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from recipes.constants import IMAGE_VARIANT_QUALITY, RECIPE_IMAGE_VARIANTS
+from recipes.models import Recipe
+from users.constants import AVATAR_VARIANTS
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# {модель: (поле картинки, варианты)}.
+VARIANTS = {
+    Recipe: ('image', RECIPE_IMAGE_VARIANTS),
+    User: ('avatar', AVATAR_VARIANTS),
+}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+# При IMAGE_WORKERS = 0 варианты строятся сразу после фиксации
+# транзакции в том же потоке (удобно для команд и отладки).
+executor = (ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                               thread_name_prefix='image-variants')
+            if settings.IMAGE_WORKERS else None)
+
+
+def source_name(instance):
+    field_name, _ = VARIANTS[instance._meta.concrete_model]
+    return getattr(instance, field_name).name or ''
+
+
+def needs_variants(instance):
+    """Построены ли варианты для текущей картинки объекта."""
+    return source_name(instance) != instance.image_variants.get('source', '')
+
+
+def variant_url(instance, variant):
+    """URL варианта картинки или оригинала, пока вариант не построен."""
+    field_name, _ = VARIANTS[instance._meta.concrete_model]
+    image = getattr(instance, field_name)
+    if not image:
+        return None
+    variants = instance.image_variants
+    if variants.get('source') == image.name and variant in variants:
+        return image.storage.url(variants[variant])
+    return image.url
+
+
+def variant_urls(instance):
+    _, variants = VARIANTS[instance._meta.concrete_model]
+    return {variant: variant_url(instance, variant) for variant in variants}
+
+
+def variant_path(source, variant, image_format):
+    directory, name = os.path.split(source)
+    stem, _ = os.path.splitext(name)
+    return os.path.join(directory, 'variants',
+                        f'{stem}_{variant}.{EXTENSIONS[image_format]}')
+
+
+def render(image, size, crop, image_format):
+    if crop:
+        result = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+    else:
+        result = image.copy()
+        result.thumbnail(size, Image.Resampling.LANCZOS)
+    if image_format == 'JPEG' and result.mode not in ('RGB', 'L'):
+        result = result.convert('RGB')
+    buffer = io.BytesIO()
+    result.save(buffer, image_format, quality=IMAGE_VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+def delete_variants(storage, variants):
+    for variant, path in variants.items():
+        if variant != 'source':
+            storage.delete(path)
+
+
+def build_variants(model, pk):
+    """Строит варианты текущей картинки объекта и сохраняет их пути."""
+    field_name, specs = VARIANTS[model]
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        if instance is None or not needs_variants(instance):
+            return
+        image = getattr(instance, field_name)
+        source = source_name(instance)
+        previous = instance.image_variants
+        variants = {}
+        if source:
+            variants['source'] = source
+            with image.storage.open(source) as file:
+                picture = ImageOps.exif_transpose(Image.open(file))
+                for variant, (size, crop, image_format) in specs.items():
+                    variants[variant] = image.storage.save(
+                        variant_path(source, variant, image_format),
+                        ContentFile(render(picture, size, crop,
+                                           image_format)))
+        # Картинку могли сменить, пока строились варианты.
+        instance.refresh_from_db(fields=[field_name])
+        if source_name(instance) != source:
+            delete_variants(image.storage, variants)
+            return
+        instance.image_variants = variants
+        # auto_now-поля (Recipe.updated) тоже: от них зависят ключи
+        # кэша представлений (api.fragments).
+        instance.save(update_fields=['image_variants', *(
+            field.name for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now', False))])
+        delete_variants(image.storage, previous)
+    except Exception:
+        logger.exception('Не удалось построить варианты картинки %s #%s',
+                         model.__name__, pk)
+
+
+def build_in_pool(model, pk):
+    try:
+        build_variants(model, pk)
+    finally:
+        # Соединение потока пула с БД не переживает задачу.
+        connection.close()
+
+
+def run(model, pk):
+    if executor is None:
+        build_variants(model, pk)
+    else:
+        executor.submit(build_in_pool, model, pk)
+
+
+def schedule_variants(instance):
+    """Построить варианты картинки после фиксации текущей транзакции."""
+    model = instance._meta.concrete_model
+    pk = instance.pk
+    transaction.on_commit(lambda: run(model, pk))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import VARIANTS, build_variants, needs_variants
+
+
+class Command(BaseCommand):
+    help = ('Строит недостающие варианты картинок рецептов и аватаров '
+            '(миниатюры и WebP), например для загруженных до их появления.')
+
+    def handle(self, *args, **options):
+        for model, (field_name, _) in VARIANTS.items():
+            built = 0
+            for instance in model.objects.only(
+                    'pk', field_name, 'image_variants').iterator():
+                if needs_variants(instance):
+                    build_variants(model, instance.pk)
+                    built += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: '
+                f'построены варианты для {built}.'))
@@ -0,0 +1,137 @@
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.constants import (
+    MAX_LENGTH_INGRIDIENT_NAME,
+    MAX_LENGTH_MEASURMENT_UNIT,
+)
+from recipes.models import Ingredient
+from recipes.utils import normalize_name
+from recipes.versioning import INGREDIENTS, bump_data_version
+
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Строки CSV вида: название,единица измерения."""
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1] if len(row) > 1 else ''
+
+
+def read_json(file):
+    """
+    Элементы JSON-массива по одному, не загружая файл целиком.
+    Понимает и формат фикстуры loaddata (данные в ключе 'fields').
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Элемент прочитан не полностью: дочитаем файл.
+                if not chunk:
+                    raise CommandError('Некорректный JSON в конце файла.')
+                break
+            item = item.get('fields', item)
+            yield item.get('name', ''), item.get('measurement_unit', '')
+        if not chunk:
+            return
+
+
+class Command(BaseCommand):
+    help = ('Загружает справочник ингредиентов из CSV или JSON. '
+            'Существующие ингредиенты обновляются, новые добавляются; '
+            'команду безопасно запускать повторно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv или .json.')
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла, по умолчанию - по расширению.',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        readers = {'csv': read_csv, 'json': read_json}
+        if file_format not in readers:
+            raise CommandError('Укажите формат файла: --format csv|json.')
+        self.counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        with open(path, encoding='utf-8') as file:
+            rows = readers[file_format](file)
+            while True:
+                batch = list(islice(rows, BATCH_SIZE))
+                if not batch:
+                    break
+                self.load_batch(batch)
+        if self.counts['inserted'] or self.counts['updated']:
+            bump_data_version(INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS(
+            'Добавлено: {inserted}, обновлено: {updated}, '
+            'пропущено: {skipped}.'.format(**self.counts)))
+
+    def load_batch(self, batch):
+        ingredients = {}
+        for name, measurement_unit in batch:
+            name = ' '.join(str(name).split())
+            measurement_unit = ' '.join(str(measurement_unit).split())
+            if (not name or not measurement_unit
+                    or len(name) > MAX_LENGTH_INGRIDIENT_NAME
+                    or len(measurement_unit) > MAX_LENGTH_MEASURMENT_UNIT
+                    or (name, measurement_unit) in ingredients):
+                self.counts['skipped'] += 1
+                continue
+            ingredients[name, measurement_unit] = Ingredient(
+                name=name,
+                measurement_unit=measurement_unit,
+                search_name=normalize_name(name),
+            )
+        existing = {
+            (name, measurement_unit): search_name
+            for name, measurement_unit, search_name in (
+                Ingredient.objects
+                .filter(name__in={name for name, _ in ingredients})
+                .values_list('name', 'measurement_unit', 'search_name'))
+        }
+        changed = []
+        for key, ingredient in ingredients.items():
+            if key not in existing:
+                self.counts['inserted'] += 1
+            elif existing[key] != ingredient.search_name:
+                self.counts['updated'] += 1
+            else:
+                self.counts['skipped'] += 1
+                continue
+            changed.append(ingredient)
+        # Вставка с обновлением по уникальной паре (name, measurement_unit):
+        # повторный запуск и параллельная загрузка не создадут дублей.
+        Ingredient.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=('name', 'measurement_unit'),
+            update_fields=('search_name',),
+        )
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingCartIngredient
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает суммы ингредиентов в списках покупок '
+            '(ShoppingCartIngredient) или сверяет их с рецептами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить таблицу с рецептами, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            return self.check_totals()
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.all().delete()
+            batch = []
+            created = 0
+            for user_id, ingredient_id, total in (
+                ShoppingCartIngredient.objects.live_totals().iterator()
+            ):
+                batch.append(ShoppingCartIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=total))
+                if len(batch) == BATCH_SIZE:
+                    ShoppingCartIngredient.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            ShoppingCartIngredient.objects.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны: {created} строк.'))
+
+    def check_totals(self):
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in (
+                ShoppingCartIngredient.objects.live_totals().iterator())
+        }
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in (
+                ShoppingCartIngredient.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount').iterator())
+        }
+        mismatched = {
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        }
+        for user_id, ingredient_id in sorted(mismatched):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'в таблице {actual.get((user_id, ingredient_id))}, '
+                f'по рецептам {expected.get((user_id, ingredient_id))}')
+        if mismatched:
+            raise CommandError(
+                f'Расхождений: {len(mismatched)}. '
+                'Запустите команду без --check, чтобы пересобрать таблицу.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Расхождений нет, строк: {len(actual)}.'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import COUNTERS, drifted, reconcile
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счетчики рецептов и пользователей (favorites_count, '
+            'in_carts_count, recipes_count, followers_count) с данными '
+            'и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить счетчики, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            return self.check_counters()
+        fixed = 0
+        with transaction.atomic():
+            for model, field, rows, link in COUNTERS:
+                count = reconcile(model, field, rows, link)
+                fixed += count
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}.{field}: '
+                    f'исправлено {count}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики сверены, исправлено: {fixed}.'))
+
+    def check_counters(self):
+        mismatched = 0
+        for model, field, rows, link in COUNTERS:
+            rows_drifted = drifted(model, field, rows, link).values_list(
+                'pk', field, 'actual')
+            for pk, value, actual in rows_drifted.iterator():
+                mismatched += 1
+                self.stdout.write(
+                    f'{model._meta.model_name}={pk} {field}: '
+                    f'в строке {value}, по данным {actual}')
+        if mismatched:
+            raise CommandError(
+                f'Расхождений: {mismatched}. '
+                'Запустите команду без --check, чтобы их исправить.')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
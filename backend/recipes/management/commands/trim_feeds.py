@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.constants import FEED_MAX_LENGTH
+from recipes.feed import trim_feeds
+
+
+class Command(BaseCommand):
+    help = ('Укорачивает ленты подписок до последних рецептов '
+            '(по умолчанию FEED_MAX_LENGTH). Запускайте по расписанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-length', type=int,
+                            default=FEED_MAX_LENGTH,
+                            help='Сколько рецептов оставить в ленте.')
+
+    def handle(self, *args, **options):
+        if options['max_length'] < 1:
+            raise CommandError('--max-length должен быть больше нуля.')
+        deleted = trim_feeds(options['max_length'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты укорочены: удалено записей {deleted}.'))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг рецептов «в тренде» '
+            '(?ordering=trending). Запускайте по расписанию, '
+            'например раз в 10 минут.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated, reset = update_trending()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересчитан: рецептов {updated}, обнулено {reset}, '
+            f'{time.monotonic() - started:.2f} с.'))
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Коды коротких ссылок теперь вычисляются из id рецепта.
+    # Уже выданные коды сохраняются в legacy_short_url_code,
+    # чтобы старые ссылки продолжали работать.
+
+    dependencies = [
+        ('recipes', '0004_shoppingcartingredient'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='short_url_code',
+            new_name='legacy_short_url_code',
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='legacy_short_url_code',
+            field=models.CharField(blank=True, editable=False, max_length=5, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:36
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+# (модель со счетчиком, поле счетчика, модель строк, поле связи строки),
+# как recipes.counters.COUNTERS.
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipe', 'in_carts_count', 'recipes.ShoppingList', 'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'users.Follow', 'following'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model, field, rows, link in COUNTERS:
+        model = apps.get_model(model)
+        rows = apps.get_model(rows)
+        total = (rows.objects
+                 .filter(**{link: models.OuterRef('pk')})
+                 .order_by()
+                 .values(link)
+                 .annotate(total=models.Count('pk'))
+                 .values('total'))
+        model.objects.update(**{field: Coalesce(models.Subquery(total),
+                                                models.Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_image_variants'),
+        ('users', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в списки покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['favorites_count', 'id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from recipes.fulltext import install, uninstall
+
+
+def install_fulltext(apps, schema_editor):
+    install(schema_editor.connection)
+
+
+def uninstall_fulltext(apps, schema_editor):
+    uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_fulltext, uninstall_fulltext),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.16 on 2026-10-18 03:14
+
+import time
+
+from django.db import migrations, models
+
+# Наборы данных recipes.versioning.
+DATASETS = ('ingredients', 'tags')
+
+
+def create_versions(apps, schema_editor):
+    DataVersion = apps.get_model('recipes', 'DataVersion')
+    version = time.time_ns()
+    DataVersion.objects.bulk_create(
+        [DataVersion(name=name, version=version) for name in DATASETS],
+        ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Набор данных')),
+                ('version', models.BigIntegerField(verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия данных',
+                'verbose_name_plural': 'Версии данных',
+            },
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,10 @@
-import uuid
-
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 from recipes.constants import (
+    MAX_LENGTH_DATA_VERSION_NAME,
     MAX_LENGTH_INGRIDIENT_NAME,
     MAX_LENGTH_MEASURMENT_UNIT,
     MAX_LENGTH_RECIPE_NAME,
@@ -13,7 +13,8 @@ from recipes.constants import (
     MIN_AMOUNT_OF_INGREDIENT,
     MIN_COOKING_TIME_MINUTES,
 )
-from users.models import User
+from recipes.short_links import encode_id
+from users.models import ComputedFieldsMixin, Follow, User
 
 
 class Tag(models.Model):
@@ -68,6 +69,15 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения',
         help_text='Единица измерения: обязательное поле',
     )
+    # Нормализованное название для поиска, см. recipes.utils.normalize_name.
+    # Заполняется сигналом pre_save, на PostgreSQL по нему построен
+    # GIN-индекс pg_trgm (миграция 0003).
+    search_name = models.CharField(
+        max_length=MAX_LENGTH_INGRIDIENT_NAME,
+        verbose_name='Название для поиска',
+        editable=False,
+        default='',
+    )
 
     class Meta:
         ordering = ('name',)
@@ -84,9 +94,89 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}.'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов к рецептам для их чтения через API."""
+
+    def with_user_flags(self, user):
+        """
+        Аннотирует рецепты флагами is_favorited и is_in_shopping_cart.
+        Для анонимного пользователя оба флага всегда False.
+        """
+        if not user.is_authenticated:
+            return self.annotate(is_favorited=models.Value(False),
+                                 is_in_shopping_cart=models.Value(False))
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingList.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+        )
+
+    def with_author_subscription(self, user):
+        """Аннотирует рецепты флагом подписки юзера на их автора."""
+        if not user.is_authenticated:
+            return self.annotate(author_is_subscribed=models.Value(False))
+        return self.annotate(author_is_subscribed=models.Exists(
+            Follow.objects.filter(user=user,
+                                  following=models.OuterRef('author'))
+        ))
+
+    def with_relations(self):
+        """Автор, теги и ингредиенты рецептов - без данных юзера."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'),
+            ),
+        )
+
+    def for_read(self, user):
+        """
+        Загружает страницу рецептов за фиксированное число запросов,
+        не зависящее от количества рецептов:
+        - рецепты с флагами пользователя (EXISTS-подзапросы);
+        - авторы с флагом подписки;
+        - теги;
+        - ингредиенты вместе с названиями и единицами измерения.
+        """
+        return self.with_user_flags(user).prefetch_related(
+            models.Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(user),
+            ),
+            'tags',
+            models.Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'),
+            ),
+        )
+
+    def lock(self):
+        """
+        Блокирует строки рецептов до конца транзакции. NO KEY: вставки
+        строк со ссылкой на рецепт (ShoppingList) она не задерживает.
+        """
+        return list(self.select_for_update(no_key=True).order_by('pk')
+                    .values_list('pk', flat=True))
+
+    def touch(self):
+        """
+        Отмечает рецепты измененными (поле updated) без сигналов.
+        Для правок связей рецепта: updated входит в ключ фрагмента
+        представления (api.fragments).
+        """
+        return self.update(updated=timezone.now())
+
+
+class Recipe(ComputedFieldsMixin, models.Model):
     """Класс, описывающий структуру рецепта."""
 
+    COMPUTED_FIELDS = ('favorites_count', 'in_carts_count',
+                       'trending_score')
+
     tags = models.ManyToManyField(
         Tag,
         verbose_name='Список id тегов',
@@ -121,23 +211,71 @@ class Recipe(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Автор рецепта',
         related_name='recipes',
+        # Поиск по автору идет по индексу recipe_author_id_idx.
+        db_index=False,
+    )
+    # Пути вариантов картинки, см. recipes.images.
+    image_variants = models.JSONField(default=dict,
+                                      blank=True,
+                                      editable=False)
+    # Счетчики, см. recipes.counters.
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в списки покупок',
+    )
+    # Рейтинг «в тренде», см. recipes.trending.
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Рейтинг в тренде',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата публикации',
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
     )
-    short_url_code = models.CharField(
+    # Код короткой ссылки старого формата (uuid4().hex[:5]) у рецептов,
+    # созданных до перехода на коды из id; у новых рецептов пуст.
+    legacy_short_url_code = models.CharField(
         max_length=5,
         unique=True,
-        editable=False
+        null=True,
+        blank=True,
+        editable=False,
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ('name',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            # Сортировка по популярности: ?ordering=-favorites_count,-id.
+            models.Index(fields=('favorites_count', 'id'),
+                         name='recipe_favorites_count_idx'),
+            # ?ordering=trending.
+            models.Index(fields=('trending_score', 'id'),
+                         name='recipe_trending_score_idx'),
+            # Рецепты автора, новые первыми: ?author=, рецепты подписок.
+            models.Index(fields=('author', 'id'),
+                         name='recipe_author_id_idx'),
+        )
 
-    def save(self, *args, **kwargs):
-        if not self.short_url_code:
-            # Генерируем уникальный код
-            self.short_url_code = uuid.uuid4().hex[:5]
-        super().save(*args, **kwargs)
+    @property
+    def short_url_code(self):
+        """Код короткой ссылки: вычисляется из id (recipes.short_links)."""
+        return encode_id(self.pk)
 
     def __str__(self):
         return f'Рецепт {self.name} от {self.author.username}.'
@@ -155,7 +293,9 @@ class RecipeIngredient(models.Model):
         Ingredient,
         on_delete=models.CASCADE,
         related_name='+',  # Можно узнать в каких рец. исп. ингредиент.
-        verbose_name='Ингредиент'
+        verbose_name='Ингредиент',
+        # Поиск по ингредиенту идет по индексу recipeingr_ingredient_idx.
+        db_index=False,
     )
     amount = models.PositiveSmallIntegerField(
         verbose_name='Количество',
@@ -180,6 +320,11 @@ class RecipeIngredient(models.Model):
                 name='recipe_ingredient_pair_unique'
             ),
         )
+        indexes = (
+            # Рецепты с ингредиентом: только по индексу, без чтения строк.
+            models.Index(fields=('ingredient', 'recipe'),
+                         name='recipeingr_ingredient_idx'),
+        )
 
     def __str__(self):
         return f'Ингредиент {self.ingredient.name}: кол-во {self.amount}'
@@ -199,6 +344,11 @@ class MutualFields(models.Model):
         related_name='%(class)s',
         verbose_name='Рецепт',
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата добавления',
+    )
 
     class Meta:
         abstract = True
@@ -229,3 +379,194 @@ class ShoppingList(MutualFields):
 
     def __str__(self):
         return f'{self.user} купит продукты для {self.recipe}.'
+
+
+class ShoppingCartIngredientManager(models.Manager):
+    """
+    Инкрементальное обновление суммарного списка покупок.
+    Изменения передаются словарем {id ингредиента: изменение количества}.
+    """
+
+    def apply_deltas(self, user_ids, deltas):
+        """Прибавляет изменения количеств к спискам покупок юзеров."""
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic():
+            # Изменения списков одного юзера выполняются по очереди:
+            # иначе две транзакции вставили бы одну строку (user,
+            # ingredient), и вторая упала бы на уникальности. Блокировка
+            # строки юзера (в порядке id - без взаимных блокировок)
+            # охраняет и еще не созданные строки его списка. NO KEY:
+            # вставки строк со ссылкой на юзера она не задерживает.
+            list(User.objects.select_for_update(no_key=True)
+                 .filter(pk__in=user_ids).order_by('pk')
+                 .values_list('pk', flat=True))
+            items = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.select_for_update().filter(
+                    user_id__in=user_ids, ingredient_id__in=deltas)
+            }
+            to_create, to_update, to_delete = [], [], []
+            for user_id in user_ids:
+                for ingredient_id, delta in deltas.items():
+                    item = items.get((user_id, ingredient_id))
+                    if item is None:
+                        if delta > 0:
+                            to_create.append(self.model(
+                                user_id=user_id,
+                                ingredient_id=ingredient_id,
+                                amount=delta))
+                        continue
+                    item.amount += delta
+                    if item.amount > 0:
+                        to_update.append(item)
+                    else:
+                        to_delete.append(item.pk)
+            self.bulk_create(to_create)
+            self.bulk_update(to_update, ['amount'])
+            self.filter(pk__in=to_delete).delete()
+
+    def recipe_deltas(self, recipe, sign=1):
+        return {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe=recipe).values_list('ingredient_id', 'amount')
+        }
+
+    # Строки рецепта читаются под блокировкой рецепта, как и при его
+    # правке (RecipeCreateSerializer.update): иначе правка могла бы
+    # пройти между чтением строк и записью списка, и список не получил бы
+    # ее изменений.
+    def add_recipe(self, user_id, recipe):
+        """Рецепт добавлен в список покупок юзера."""
+        with transaction.atomic():
+            Recipe.objects.filter(pk=getattr(recipe, 'pk', recipe)).lock()
+            self.apply_deltas([user_id], self.recipe_deltas(recipe))
+
+    def remove_recipe(self, user_id, recipe):
+        """Рецепт убран из списка покупок юзера."""
+        with transaction.atomic():
+            Recipe.objects.filter(pk=getattr(recipe, 'pk', recipe)).lock()
+            self.apply_deltas([user_id],
+                              self.recipe_deltas(recipe, sign=-1))
+
+    def change_recipe(self, recipe, deltas):
+        """Изменились ингредиенты рецепта, лежащего в чьих-то списках."""
+        if not any(deltas.values()):
+            return
+        user_ids = list(ShoppingList.objects.filter(
+            recipe=recipe).values_list('user_id', flat=True))
+        self.apply_deltas(user_ids, deltas)
+
+    def lines(self, user):
+        """Строки списка покупок юзера для выгрузки, по алфавиту."""
+        return (self.filter(user=user)
+                .values('ingredient__name',
+                        'ingredient__measurement_unit',
+                        'amount')
+                .order_by('ingredient__name'))
+
+    def live_totals(self):
+        """Суммы ингредиентов по всем спискам покупок, из рецептов."""
+        return (RecipeIngredient.objects
+                .filter(recipe__shoppinglist__isnull=False)
+                .values_list('recipe__shoppinglist__user', 'ingredient')
+                .annotate(total=models.Sum('amount'))
+                .order_by())
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Материализованный итог по рецептам из ShoppingList: обновляется
+    при добавлении и удалении рецептов и при изменении их ингредиентов.
+    Пересобрать и сверить: manage.py rebuild_shopping_carts.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='shopping_cart_user_ingredient_unique'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя (fan-out on write).
+    Новые рецепты раскладываются по лентам подписчиков автора,
+    см. recipes.feed.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+
+    class Meta:
+        ordering = ('-recipe_id',)
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            # Индекс (user, recipe) служит и для выборки ленты.
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='timeline_user_recipe_unique'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class DataVersion(models.Model):
+    """
+    Версия справочных данных (см. recipes.versioning). Хранится в базе,
+    чтобы изменение видели все процессы: воркеры сервера и команды
+    manage.py.
+    """
+    name = models.CharField(
+        primary_key=True,
+        max_length=MAX_LENGTH_DATA_VERSION_NAME,
+        verbose_name='Набор данных',
+    )
+    version = models.BigIntegerField(verbose_name='Версия')
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
@@ -0,0 +1,194 @@
+# Ранжированный поиск ингредиентов.
+#
+# Порядок выдачи:
+# 1. название начинается с запроса;
+# 2. с запроса начинается одно из следующих слов названия;
+# 3. названия, похожие на запрос по триграммам (опечатки).
+# Первые две группы ищутся в памяти процесса без обращения к базе данных.
+# Третья нужна, только если первых двух не хватило: на PostgreSQL ее
+# находит pg_trgm по индексу на search_name, на прочих СУБД (SQLite) -
+# триграммный индекс в памяти.
+import re
+from bisect import bisect_left
+from collections import Counter
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+
+from recipes.constants import FUZZY_SEARCH_MIN_RESULTS, TRIGRAM_THRESHOLD
+from recipes.models import Ingredient
+from recipes.utils import normalize_name
+from recipes.versioning import (
+    INGREDIENTS,
+    aget_data_version,
+    get_data_version,
+)
+
+
+def trigrams(text):
+    """Множество триграмм строки, как их считает pg_trgm."""
+    grams = set()
+    for word in re.findall(r'\w+', text):
+        word = f'  {word} '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class IngredientIndex:
+    """
+    Индекс названий ингредиентов для автодополнения.
+
+    Хранит отсортированные массивы нормализованных названий и их слов
+    и ищет по префиксу двоичным поиском (bisect), а также обратный
+    триграммный индекс для нечеткого поиска.
+    Индекс строится один раз на воркер и перестраивается,
+    когда меняется версия данных 'ingredients' (см. recipes.signals).
+    Версию поток помнит DATA_VERSION_TTL секунд (recipes.versioning),
+    так что поиск по теплому индексу не обращается к базе.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.version = None
+        # Кортеж данных индекса подменяется целиком при перестроении.
+        self.entries = ([], [], [], {}, [])
+
+    def build(self, version):
+        rows = sorted(
+            (normalize_name(name), name, pk, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit')
+        )
+        keys = [row[0] for row in rows]
+        items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, name, pk, measurement_unit in rows
+        ]
+        # Начала второго и следующих слов: ('соус', 5) для 'томатный соус'.
+        words = sorted(
+            (key[start + 1:], position)
+            for position, key in enumerate(keys)
+            for start, char in enumerate(key) if char == ' '
+        )
+        postings = {}
+        sizes = []
+        for position, key in enumerate(keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        self.entries = (keys, items, words, postings, sizes)
+        self.version = version
+
+    def refresh(self):
+        version = get_data_version(INGREDIENTS)
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.build(version)
+
+    def search(self, query, limit=None):
+        """Ингредиенты, подходящие под запрос, в порядке релевантности."""
+        self.refresh()
+        query = normalize_name(query)
+        found, seen, rest = self.match(query, limit)
+        if rest is not False:
+            if connection.vendor == 'postgresql':
+                found.extend(self.similar_in_db(
+                    query, rest, [item['id'] for item in found]))
+            else:
+                found.extend(self.similar_items(query, rest, seen))
+        return found
+
+    async def asearch(self, query, limit=None):
+        """search для асинхронных вью: запросы через async ORM."""
+        if await aget_data_version(INGREDIENTS) != self.version:
+            await sync_to_async(self.refresh)()
+        query = normalize_name(query)
+        found, seen, rest = self.match(query, limit)
+        if rest is not False:
+            if connection.vendor == 'postgresql':
+                queryset = self.similar_in_db(
+                    query, rest, [item['id'] for item in found])
+                found.extend([row async for row in queryset])
+            else:
+                found.extend(self.similar_items(query, rest, seen))
+        return found
+
+    def match(self, query, limit):
+        """
+        Совпадения по началу названия и по началу слов.
+        Возвращает найденное, их позиции и сколько еще искать
+        по триграммам (None - без ограничения, False - не нужно).
+        """
+        keys, items, words, _, _ = self.entries
+        found = []
+        seen = set()
+
+        def is_full():
+            return limit is not None and len(found) >= limit
+
+        index = bisect_left(keys, query)
+        while (index < len(keys) and keys[index].startswith(query)
+               and not is_full()):
+            found.append(items[index])
+            seen.add(index)
+            index += 1
+
+        word_matches = []
+        index = bisect_left(words, (query,))
+        while index < len(words) and words[index][0].startswith(query):
+            position = words[index][1]
+            if position not in seen:
+                word_matches.append(position)
+                seen.add(position)
+            index += 1
+        for position in sorted(word_matches):
+            if is_full():
+                break
+            found.append(items[position])
+
+        if len(found) >= FUZZY_SEARCH_MIN_RESULTS or is_full():
+            return found, seen, False
+        return found, seen, None if limit is None else limit - len(found)
+
+    def similar_items(self, query, limit, exclude):
+        _, items, _, _, _ = self.entries
+        return [items[position]
+                for position in self.similar(query, limit, exclude)]
+
+    def similar(self, query, limit, exclude):
+        """Позиции названий, похожих на запрос (замена pg_trgm)."""
+        keys, _, _, postings, sizes = self.entries
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(postings.get(gram, ()))
+        scored = []
+        for position, common in shared.items():
+            if position in exclude:
+                continue
+            similarity = common / (len(grams) + sizes[position] - common)
+            if similarity >= TRIGRAM_THRESHOLD:
+                scored.append((-similarity, keys[position], position))
+        scored.sort()
+        return [position for _, _, position in scored[:limit]]
+
+    def similar_in_db(self, query, limit, exclude):
+        """
+        Названия, похожие на запрос, по триграммному индексу pg_trgm
+        (ленивый queryset словарей).
+        """
+        queryset = (Ingredient.objects
+                    .filter(search_name__trigram_similar=query)
+                    .exclude(pk__in=exclude)
+                    .annotate(similarity=TrigramSimilarity('search_name',
+                                                           query))
+                    .order_by('-similarity', 'search_name')
+                    .values('id', 'name', 'measurement_unit'))
+        return queryset if limit is None else queryset[:limit]
+
+
+ingredient_index = IngredientIndex()
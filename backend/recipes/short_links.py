@@ -0,0 +1,63 @@
+# Короткие ссылки на рецепты.
+#
+# Код вычисляется из id рецепта и обратно без обращения к базе данных:
+# младшие 32 бита id перемешиваются секретной перестановкой (сеть Фейстеля
+# из четырех раундов), результат записывается в base62 и дополняется
+# до SHORT_LINK_LENGTH символов. Перестановка взаимно однозначна, поэтому
+# коллизий нет, а соседние id дают непохожие коды.
+# Секрет - settings.SHORT_LINK_SECRET; при его смене все ссылки изменятся.
+import hashlib
+import string
+
+from django.conf import settings
+
+from recipes.constants import SHORT_LINK_LENGTH
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+DIGITS = {char: value for value, char in enumerate(ALPHABET)}
+HALF_BITS = 16
+HALF_MASK = (1 << HALF_BITS) - 1
+LOW_MASK = (1 << 2 * HALF_BITS) - 1
+ROUNDS = 4
+
+
+def round_value(round_number, half):
+    digest = hashlib.blake2b(
+        f'{round_number}:{half}'.encode(),
+        key=settings.SHORT_LINK_SECRET.encode()[:64],
+        digest_size=4,
+    ).digest()
+    return int.from_bytes(digest, 'big') & HALF_MASK
+
+
+def permute(value, rounds):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for round_number in rounds:
+        left, right = right, left ^ round_value(round_number, right)
+    return right << HALF_BITS | left
+
+
+def encode_id(pk):
+    """Короткий код рецепта по его id."""
+    number = pk & ~LOW_MASK | permute(pk & LOW_MASK, range(ROUNDS))
+    code = ''
+    while number:
+        number, digit = divmod(number, BASE)
+        code = ALPHABET[digit] + code
+    return code.rjust(SHORT_LINK_LENGTH, ALPHABET[0])
+
+
+def decode_code(code):
+    """id рецепта по короткому коду или None, если код не наш."""
+    if len(code) < SHORT_LINK_LENGTH:
+        return None
+    number = 0
+    for char in code:
+        if char not in DIGITS:
+            return None
+        number = number * BASE + DIGITS[char]
+    pk = number & ~LOW_MASK | permute(number & LOW_MASK,
+                                      reversed(range(ROUNDS)))
+    # Отсекаем неканонические записи (лишние ведущие нули).
+    return pk if pk and encode_id(pk) == code else None
@@ -0,0 +1,147 @@
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from recipes.counters import count_row
+from recipes.feed import follow, schedule_fan_out, unfollow
+from recipes.images import needs_variants, schedule_variants
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCartIngredient,
+    ShoppingList,
+    Tag,
+)
+from recipes.utils import normalize_name
+from recipes.versioning import INGREDIENTS, TAGS, bump_data_version
+from users.models import Follow, User
+
+
+@receiver(pre_save, sender=Ingredient)
+def fill_search_name(instance, **kwargs):
+    """Заполняет нормализованное название, в том числе при loaddata."""
+    instance.search_name = normalize_name(instance.name)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(**kwargs):
+    """
+    Изменение справочника ингредиентов сбрасывает индекс поиска
+    и готовые ответы /api/ingredients/.
+    """
+    bump_data_version(INGREDIENTS)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(**kwargs):
+    """Изменение тегов сбрасывает готовые ответы /api/tags/."""
+    bump_data_version(TAGS)
+
+
+@receiver(post_save, sender=ShoppingList)
+def recipe_added_to_cart(instance, created, raw, **kwargs):
+    """Прибавляет ингредиенты рецепта к списку покупок юзера."""
+    if created and not raw:
+        ShoppingCartIngredient.objects.add_recipe(instance.user_id,
+                                                  instance.recipe_id)
+
+
+# pre_delete, а не post_delete: при каскадном удалении рецепта его
+# ингредиенты еще не удалены, и их количества можно вычесть.
+@receiver(pre_delete, sender=ShoppingList)
+def recipe_removed_from_cart(instance, **kwargs):
+    """Вычитает ингредиенты рецепта из списка покупок юзера."""
+    ShoppingCartIngredient.objects.remove_recipe(instance.user_id,
+                                                 instance.recipe_id)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(instance, raw, **kwargs):
+    """Запоминает прежние ингредиент и количество изменяемой строки."""
+    instance.previous_line = None
+    if not raw and instance.pk is not None:
+        instance.previous_line = (
+            RecipeIngredient.objects.filter(pk=instance.pk)
+            .values_list('ingredient_id', 'amount').first())
+
+
+# API меняет ингредиенты рецепта пакетно (bulk_create, bulk_update,
+# delete() queryset) и само пересчитывает списки покупок; эти
+# обработчики - для правок строк по одной: из админки (в том числе
+# инлайном рецепта) и из шелла.
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(instance, raw, **kwargs):
+    """Изменение строки рецепта меняет суммы в списках покупок."""
+    if raw:
+        return
+    deltas = {instance.ingredient_id: instance.amount}
+    previous = getattr(instance, 'previous_line', None)
+    if previous is not None:
+        ingredient_id, amount = previous
+        deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
+    ShoppingCartIngredient.objects.change_recipe(instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(instance, origin, **kwargs):
+    """
+    Удаление строки (instance.delete()) вычитает ее из списков покупок.
+    Удаления queryset и каскадные (рецепта, ингредиента, юзера)
+    пересчитывают списки сами, здесь пропускаем.
+    """
+    if origin is instance:
+        ShoppingCartIngredient.objects.change_recipe(
+            instance.recipe_id, {instance.ingredient_id: -instance.amount})
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_saved(instance, raw, **kwargs):
+    """Новая картинка рецепта или аватар: строим их варианты в фоне."""
+    if not raw and needs_variants(instance):
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def counted_row_saved(instance, created, raw, **kwargs):
+    """Новая строка: +1 к счетчикам рецепта или юзера (recipes.counters)."""
+    if created and not raw:
+        count_row(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def counted_row_deleted(instance, **kwargs):
+    """Удаленная строка: -1 к счетчикам рецепта или юзера."""
+    count_row(instance, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, raw, **kwargs):
+    """Новый рецепт раскладывается по лентам подписчиков (recipes.feed)."""
+    if created and not raw:
+        schedule_fan_out(instance.author_id, [instance.pk])
+
+
+@receiver(post_save, sender=Follow)
+def author_followed(instance, created, raw, **kwargs):
+    """Новая подписка: рецепты автора появляются в ленте."""
+    if created and not raw:
+        follow(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def author_unfollowed(instance, **kwargs):
+    """Отписка: рецепты автора убираются из ленты."""
+    unfollow(instance.user_id, instance.following_id)
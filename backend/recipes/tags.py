@@ -0,0 +1,63 @@
+# Теги в памяти процесса.
+#
+# Фильтр рецептов по тегам (api.filters) проверяет слаги и переводит их
+# в id по этому кэшу, а не запросом к таблице тегов; фасеты
+# (recipes.facets) берут из него список тегов. Кэш перестраивается,
+# когда меняется версия данных 'tags' (recipes.signals), и когда в
+# запросе есть неизвестный ему слаг, который есть в базе.
+from threading import Lock
+
+from recipes.models import Tag
+from recipes.versioning import TAGS, get_data_version
+
+
+class TagCache:
+    """Список тегов (словари id, name, slug) и словарь {слаг: id}."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.version = None
+        # Пара (теги, {слаг: id}) подменяется целиком при перестроении.
+        self.entries = ([], {})
+
+    def refresh(self):
+        version = get_data_version(TAGS)
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    tags = list(Tag.objects.values('id', 'name', 'slug'))
+                    self.entries = (
+                        tags, {tag['slug']: tag['id'] for tag in tags})
+                    self.version = version
+        return self.entries
+
+    def tags(self):
+        return self.refresh()[0]
+
+    def ids(self):
+        return self.refresh()[1]
+
+    def knows(self, slug):
+        """
+        Есть ли тег со слагом slug. Неизвестный кэшу слаг проверяется
+        по базе (тег мог появиться без сигналов, например bulk_create
+        в другом процессе): если тег есть, кэш перестраивается.
+        """
+        if slug in self.ids():
+            return True
+        if not Tag.objects.filter(slug=slug).exists():
+            return False
+        with self.lock:
+            self.version = None
+        return slug in self.ids()
+
+
+tag_cache = TagCache()
+
+
+def tag_choices():
+    """
+    Варианты слагов для MultipleChoiceFilter. Функция, а не метод
+    tag_cache: фильтры копируются через deepcopy, а Lock не копируется.
+    """
+    return [(slug, slug) for slug in tag_cache.ids()]
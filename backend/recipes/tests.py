@@ -0,0 +1,158 @@
+from django.db import connection
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCartIngredient,
+    ShoppingList,
+)
+from recipes.search import IngredientIndex
+from users.models import User
+
+
+class ShoppingCartTotalsTest(TestCase):
+    """Суммы списка покупок следуют за правками строк рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='buyer@example.com', username='buyer',
+            first_name='Покупатель', last_name='Продуктов', password='!')
+        cls.salt, cls.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар'))
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание.', cooking_time=10,
+            author=cls.user, image='recipes/images/x.png')
+        cls.line = RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.salt, amount=5)
+        ShoppingList.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def totals(self):
+        return dict(ShoppingCartIngredient.objects.filter(
+            user=self.user).values_list('ingredient__name', 'amount'))
+
+    def test_line_changed(self):
+        self.line.amount = 7
+        self.line.save()
+        self.assertEqual(self.totals(), {'Соль': 7})
+        self.line.ingredient = self.sugar
+        self.line.save()
+        self.assertEqual(self.totals(), {'Сахар': 7})
+
+    def test_line_added_and_deleted(self):
+        line = RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.sugar, amount=3)
+        self.assertEqual(self.totals(), {'Соль': 5, 'Сахар': 3})
+        line.delete()
+        self.assertEqual(self.totals(), {'Соль': 5})
+
+    def test_recipe_deleted(self):
+        self.recipe.delete()
+        self.assertEqual(self.totals(), {})
+
+    @skipUnlessDBFeature('has_select_for_no_key_update')
+    def test_recipe_locked_before_lines_read(self):
+        for change in (ShoppingCartIngredient.objects.remove_recipe,
+                       ShoppingCartIngredient.objects.add_recipe):
+            with self.subTest(change=change.__name__):
+                with CaptureQueriesContext(connection) as queries:
+                    change(self.user.pk, self.recipe)
+                statements = [query['sql'] for query in queries]
+                lock = next(
+                    number for number, sql in enumerate(statements)
+                    if 'FROM "recipes_recipe"' in sql
+                    and 'FOR NO KEY UPDATE' in sql)
+                lines = next(
+                    number for number, sql in enumerate(statements)
+                    if 'FROM "recipes_recipeingredient"' in sql)
+                self.assertLess(lock, lines)
+
+
+class ComputedFieldsTest(TestCase):
+    """save() рецепта не затирает счетчики и рейтинг (ComputedFieldsMixin)."""
+
+    def setUp(self):
+        author = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Рецептов', password='!')
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание.', cooking_time=10,
+            author=author, image='recipes/images/x.png')
+
+    def test_counters_kept(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            favorites_count=3, trending_score=1.5)
+        stale.name = 'Новое название'
+        stale.save()
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 3)
+        self.assertEqual(recipe.trending_score, 1.5)
+
+    def test_copy(self):
+        copy = Recipe.objects.get(pk=self.recipe.pk)
+        copy.pk = None
+        copy.save()
+        self.assertNotEqual(copy.pk, self.recipe.pk)
+        self.assertEqual(Recipe.objects.filter(name='Рецепт').count(), 2)
+
+    def test_deleted_row(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Recipe.objects.filter(pk=self.recipe.pk).delete()
+        recipe.save()
+        self.assertTrue(Recipe.objects.filter(pk=self.recipe.pk).exists())
+
+    def test_deferred_fields_not_loaded(self):
+        recipe = Recipe.objects.defer('text').get(pk=self.recipe.pk)
+        recipe.name = 'Новое название'
+        with self.assertNumQueries(1):
+            recipe.save()
+        self.assertEqual(Recipe.objects.get(pk=self.recipe.pk).text,
+                         'Описание.')
+
+
+class IngredientIndexTest(TestCase):
+    """Ранжированный поиск ингредиентов (recipes.search)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Соль', 'Соль морская', 'Английская соль', 'Свёкла',
+                     'Ежевика', 'Чеснок', 'Томатный соус'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        self.index = IngredientIndex()
+
+    def names(self, query, limit=None):
+        return [item['name'] for item in self.index.search(query, limit)]
+
+    def test_prefix_before_words(self):
+        # По алфавиту 'Английская соль' шла бы первой.
+        self.assertEqual(self.names('соль'),
+                         ['Соль', 'Соль морская', 'Английская соль'])
+        self.assertEqual(self.names('соус'), ['Томатный соус'])
+
+    def test_yo(self):
+        for query in ('свек', 'свёк', 'СВЁКЛА'):
+            with self.subTest(query=query):
+                self.assertEqual(self.names(query), ['Свёкла'])
+        self.assertEqual(self.names('ёжевика'), ['Ежевика'])
+
+    def test_typo(self):
+        self.assertEqual(self.names('чесног'), ['Чеснок'])
+        self.assertEqual(self.names('сольь'), ['Соль'])
+        self.assertEqual(self.names('томатнй'), ['Томатный соус'])
+
+    def test_limit(self):
+        for limit, expected in (
+                (1, ['Соль']),
+                (2, ['Соль', 'Соль морская']),
+                (3, ['Соль', 'Соль морская', 'Английская соль'])):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.names('соль', limit), expected)
+        self.assertEqual(self.names('чесног', 1), ['Чеснок'])
@@ -0,0 +1,84 @@
+# Рейтинг рецептов «в тренде».
+#
+# Рейтинг - сумма весов событий рецепта (добавление в избранное и в список
+# покупок, публикация) за последние TRENDING_WINDOW_DAYS дней, где вес
+# каждого события уменьшается вдвое за TRENDING_HALF_LIFE_HOURS часов.
+# Рейтинг хранится в Recipe.trending_score (с индексом) и пересчитывается
+# командой manage.py update_trending по расписанию. Пересчитываются
+# только рецепты с событиями в окне и рецепты с ненулевым рейтингом:
+# остальная таблица не трогается.
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from recipes.constants import (
+    TRENDING_CART_WEIGHT,
+    TRENDING_FAVORITE_WEIGHT,
+    TRENDING_HALF_LIFE_HOURS,
+    TRENDING_NEW_RECIPE_WEIGHT,
+    TRENDING_WINDOW_DAYS,
+)
+from recipes.models import Favorite, Recipe, ShoppingList
+
+BATCH_SIZE = 500
+
+# (queryset событий, поле рецепта, вес события).
+EVENTS = (
+    (Favorite.objects.all(), 'recipe_id', TRENDING_FAVORITE_WEIGHT),
+    (ShoppingList.objects.all(), 'recipe_id', TRENDING_CART_WEIGHT),
+    (Recipe.objects.all(), 'id', TRENDING_NEW_RECIPE_WEIGHT),
+)
+
+
+def decay(age):
+    """Множитель веса события возраста age (timedelta)."""
+    return 0.5 ** (age.total_seconds() / 3600 / TRENDING_HALF_LIFE_HOURS)
+
+
+def compute_scores(now):
+    """
+    Рейтинги рецептов с событиями в окне: {id рецепта: рейтинг}.
+    События считаются в БД по часам, затухание - по часу события.
+    """
+    since = now - timedelta(days=TRENDING_WINDOW_DAYS)
+    scores = {}
+    for queryset, field, weight in EVENTS:
+        buckets = (queryset
+                   .filter(created__gte=since)
+                   .annotate(hour=TruncHour('created'))
+                   .order_by()
+                   .values_list(field, 'hour')
+                   .annotate(events=Count('pk')))
+        for recipe_id, hour, events in buckets.iterator():
+            scores[recipe_id] = (scores.get(recipe_id, 0)
+                                 + weight * events * decay(now - hour))
+    return scores
+
+
+def update_trending(now=None):
+    """
+    Пересчитывает рейтинги. Возвращает число обновленных
+    и обнуленных рецептов.
+    """
+    now = now or timezone.now()
+    scores = compute_scores(now)
+    with transaction.atomic():
+        stale = [pk for pk in (Recipe.objects
+                               .filter(trending_score__gt=0)
+                               .values_list('pk', flat=True)
+                               .iterator())
+                 if pk not in scores]
+        for start in range(0, len(stale), BATCH_SIZE):
+            Recipe.objects.filter(
+                pk__in=stale[start:start + BATCH_SIZE]).update(
+                trending_score=0)
+        Recipe.objects.bulk_update(
+            [Recipe(pk=pk, trending_score=score)
+             for pk, score in scores.items()],
+            ['trending_score'],
+            batch_size=BATCH_SIZE,
+        )
+    return len(scores), len(stale)
@@ -0,0 +1,8 @@
+# Вспомогательные утилиты приложения backend.recipes
+
+def normalize_name(name):
+    """
+    Приводит название к виду для поиска:
+    без учета регистра, 'ё' как 'е', одиночные пробелы между словами.
+    """
+    return ' '.join(name.casefold().replace('ё', 'е').split())
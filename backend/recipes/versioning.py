@@ -0,0 +1,83 @@
+# Версии справочных данных (тегов, ингредиентов и т.д.).
+#
+# Версия хранится в базе (модель DataVersion), поэтому ее изменение
+# видят все воркеры и команды manage.py (load_ingredients), какой бы
+# кэш Django ни был настроен. Версия меняется в той же транзакции, что
+# и данные; строки версий создает миграция 0012.
+#
+# Версии всех наборов читаются одним запросом и запоминаются в потоке
+# на DATA_VERSION_TTL секунд: запрос к API обычно обходится без
+# обращения к базе за версиями, а изменение в другом процессе видно
+# не позже чем через DATA_VERSION_TTL. Изменение в этом потоке видно
+# сразу. Память у каждого потока своя: поток не увидит версию, которую
+# другой поток этого процесса прочел в своей незафиксированной транзакции.
+import threading
+import time
+
+from django.conf import settings
+
+from recipes.models import DataVersion
+
+# Наборы данных с версиями.
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+
+local = threading.local()
+
+
+def remembered():
+    """Версии из памяти потока или None, если их пора перечитать."""
+    versions, expires = getattr(local, 'versions', (None, 0))
+    return versions if expires > time.monotonic() else None
+
+
+def remember(versions):
+    local.versions = (versions,
+                      time.monotonic() + settings.DATA_VERSION_TTL)
+    return versions
+
+
+def forget_data_versions():
+    """Следующее чтение версий в этом потоке пойдет в базу."""
+    local.versions = (None, 0)
+
+
+def get_data_versions():
+    """
+    Текущие версии всех наборов данных: {имя: версия}.
+    Версия - время последнего изменения данных в наносекундах.
+    """
+    versions = remembered()
+    if versions is None:
+        versions = remember(dict(
+            DataVersion.objects.values_list('name', 'version')))
+    return versions
+
+
+async def aget_data_versions():
+    """get_data_versions для асинхронных вью."""
+    versions = remembered()
+    if versions is None:
+        versions = remember({
+            name: version async for name, version
+            in DataVersion.objects.values_list('name', 'version')
+        })
+    return versions
+
+
+def get_data_version(name):
+    """Текущая версия набора данных name (0 - версии нет)."""
+    return get_data_versions().get(name, 0)
+
+
+async def aget_data_version(name):
+    return (await aget_data_versions()).get(name, 0)
+
+
+def bump_data_version(name):
+    """Отмечает изменение набора данных name."""
+    version = time.time_ns()
+    DataVersion.objects.update_or_create(name=name,
+                                         defaults={'version': version})
+    forget_data_versions()
+    return version
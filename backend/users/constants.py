@@ -6,3 +6,12 @@ MAX_LENGTH_FIRST_NAME = 150
 MAX_LENGTH_LAST_NAME = 150
 FORBIDDEN_NAME = 'me'
 MAX_FILE_SIZE_AVATAR = 5
+# Варианты аватара, формат как у RECIPE_IMAGE_VARIANTS в recipes.constants.
+AVATAR_VARIANTS = {
+    'thumbnail': ((96, 96), True, 'JPEG'),
+    'webp': ((512, 512), False, 'WEBP'),
+}
+# Форматы аватара (по содержимому файла, см. users.validators).
+AVATAR_FORMATS = ('PNG', 'JPEG')
+# Число рецептов каждого автора в списке подписок.
+RECIPES_LIMIT = 'recipes_limit'
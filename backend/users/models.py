@@ -1,4 +1,4 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
 
@@ -14,9 +14,87 @@ from users.validators import (
 )
 
 
-class User(AbstractUser):
+class ComputedFieldsMixin:
+    """
+    Вычисляемые поля COMPUTED_FIELDS (счетчики recipes.counters,
+    рейтинг recipes.trending) меняются только запросами UPDATE.
+    save() загруженной из базы строки без update_fields их не пишет:
+    объект в памяти (например, из кэша токенов) мог устареть.
+    Вставка (новый объект, копия через pk = None, строка, удаленная
+    после загрузки объекта, force_insert) пишет все поля.
+    """
+
+    COMPUTED_FIELDS = ()
+
+    def save(self, *args, update_fields=None, **kwargs):
+        deferred = self.get_deferred_fields()
+        if (update_fields is None and deferred and self.pk is not None
+                and not self._state.adding
+                and not kwargs.get('force_insert')):
+            # Как сам Django для объекта с отложенными полями: пишем только
+            # загруженные, но без вычисляемых.
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COMPUTED_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields,
+                   forced_update):
+        # UPDATE полного save(); если строки нет, Django вставит ее
+        # со всеми полями.
+        if update_fields is None and not self._state.adding:
+            values = [value for value in values
+                      if value[0].name not in self.COMPUTED_FIELDS]
+        return super()._do_update(base_qs, using, pk_val, values,
+                                  update_fields, forced_update)
+
+
+class UserQuerySet(models.QuerySet):
+    """Набор запросов к пользователям с данными для текущего юзера."""
+
+    def with_is_subscribed(self, user):
+        """
+        Аннотирует каждого блогера флагом is_subscribed.
+        Флаг вычисляется подзапросом EXISTS в том же SQL-запросе.
+        """
+        if not user.is_authenticated:
+            return self.annotate(is_subscribed=models.Value(False))
+        return self.annotate(is_subscribed=models.Exists(
+            Follow.objects.filter(user=user,
+                                  following=models.OuterRef('pk'))
+        ))
+
+    def with_recipes(self, limit=None):
+        """
+        Предзагружает рецепты авторов в prefetched_recipes,
+        не больше limit на автора.
+        Срез в Prefetch Django превращает в оконную функцию
+        ROW_NUMBER() OVER (PARTITION BY author_id): рецепты всех авторов
+        страницы загружаются одним запросом.
+        """
+        recipes = self.model._meta.get_field('recipes').related_model
+        queryset = recipes.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id')
+        if limit:
+            queryset = queryset[:limit]
+        # Срез в Prefetch в Django 4.2 работает только с to_attr.
+        return self.prefetch_related(models.Prefetch(
+            'recipes', queryset=queryset, to_attr='prefetched_recipes'))
+
+
+class FoodgramUserManager(UserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с методами UserQuerySet."""
+
+
+class User(ComputedFieldsMixin, AbstractUser):
     """Расширенный класс Пользователя в Foodgram."""
 
+    COMPUTED_FIELDS = ('recipes_count', 'followers_count')
+
     email = models.EmailField(
         max_length=MAX_LENGTH_EMAIL,
         verbose_name='Электронная почта',
@@ -59,10 +137,27 @@ class User(AbstractUser):
         blank=True,
         null=True
     )
+    # Пути вариантов аватара, см. recipes.images.
+    image_variants = models.JSONField(default=dict,
+                                      blank=True,
+                                      editable=False)
+    # Счетчики, см. recipes.counters.
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков',
+    )
 
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
     USERNAME_FIELD = 'email'
 
+    objects = FoodgramUserManager()
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
@@ -1,6 +1,7 @@
 from django.core.exceptions import ValidationError
 
 from users.constants import (
+    AVATAR_FORMATS,
     FORBIDDEN_NAME,
     MAX_FILE_SIZE_AVATAR,
 )
@@ -13,16 +14,52 @@ def validate_username(username):
             'в качестве имени пользователя Foodgram.')
 
 
+# Сигнатуры (магические байты) форматов картинок.
+# Точка в сигнатуре - любой байт: у WebP (RIFF) там размер файла.
+IMAGE_SIGNATURES = {
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'\xff\xd8\xff': 'JPEG',
+    b'GIF87a': 'GIF',
+    b'GIF89a': 'GIF',
+    b'RIFF....WEBP': 'WEBP',
+}
+SIGNATURE_LENGTH = max(len(signature) for signature in IMAGE_SIGNATURES)
+ANY_BYTE = ord('.')
+
+
+def matches(head, signature):
+    return len(head) >= len(signature) and all(
+        expected in (ANY_BYTE, actual)
+        for expected, actual in zip(signature, head))
+
+
+def image_format(head):
+    """Формат картинки по первым байтам файла или None."""
+    for signature, name in IMAGE_SIGNATURES.items():
+        if matches(head, signature):
+            return name
+    return None
+
+
+def read_head(file):
+    """Первые байты файла без смены текущей позиции."""
+    position = file.tell()
+    file.seek(0)
+    head = file.read(SIGNATURE_LENGTH)
+    file.seek(position)
+    return head
+
+
 def validate_image_size(image):
-    file_size = image.file.size
+    # Размер берется из хранилища или загрузки, файл не читается.
     # 5 МБ = 5 * 1024 Байт * 1024 Килобайт
-    if file_size > MAX_FILE_SIZE_AVATAR * 1024 * 1024:
+    if image.size > MAX_FILE_SIZE_AVATAR * 1024 * 1024:
         raise ValidationError(
             f'Размер файла не должен превышать {MAX_FILE_SIZE_AVATAR} МБ.'
         )
 
 
 def validate_image_format(image):
-    valid_formats = ['.png', '.jpg', '.jpeg']
-    if not any(image.name.endswith(fmt) for fmt in valid_formats):
+    # Формат проверяется по содержимому, а не по расширению имени.
+    if image_format(read_head(image)) not in AVATAR_FORMATS:
         raise ValidationError('Разрешены только файлы формата PNG, JPG, JPEG.')